@@ -0,0 +1,110 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+# счетчики пользователя меняются UPDATE-ом в обход модели
+# (см. recipes.counters): у закешированного пользователя они
+# не загружаются, чтобы save() не записал устаревшие значения
+DEFERRED_FIELDS = ('recipes_count', 'followers_count')
+
+_lock = threading.Lock()
+_local = OrderedDict()
+
+
+def cache_key(key):
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def local_get(key):
+    with _lock:
+        entry = _local.get(key)
+        if entry is None:
+            return None
+        expires, token = entry
+        if expires < time.monotonic():
+            del _local[key]
+            return None
+        _local.move_to_end(key)
+        return token
+
+
+def local_set(key, token):
+    timeout = getattr(settings, 'TOKEN_LOCAL_CACHE_TIMEOUT', 5)
+    size = getattr(settings, 'TOKEN_LOCAL_CACHE_SIZE', 1000)
+    with _lock:
+        _local[key] = (time.monotonic() + timeout, token)
+        _local.move_to_end(key)
+        while len(_local) > size:
+            _local.popitem(last=False)
+
+
+def invalidate_tokens(keys):
+    """Убирает токены keys из кеша этого процесса и общего кеша."""
+    keys = list(keys)
+    with _lock:
+        for key in keys:
+            _local.pop(key, None)
+    cache.delete_many([cache_key(key) for key in keys])
+
+
+def invalidate_user_tokens(user_ids):
+    """Убирает из кеша токены пользователей user_ids."""
+    invalidate_tokens(Token.objects.filter(
+        user_id__in=user_ids).values_list('key', flat=True))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication с кешем токен → пользователь.
+
+    Токен ищется сначала в памяти процесса (TOKEN_LOCAL_CACHE_TIMEOUT
+    секунд, не больше TOKEN_LOCAL_CACHE_SIZE токенов), затем в кеше
+    Django (TOKEN_CACHE_TIMEOUT секунд) и только потом в базе.
+    Выход, удаление токена, изменение и блокировка пользователя
+    сразу убирают токен из общего кеша (см. api.signals); другие
+    процессы перестают его принимать не позже чем через
+    TOKEN_LOCAL_CACHE_TIMEOUT секунд.
+    """
+
+    def get_token(self, key):
+        token = local_get(key)
+        if token is not None:
+            return token
+        token = cache.get(cache_key(key))
+        if token is None:
+            # с основной базы: токен, выданный при входе, мог еще
+            # не дойти до реплик (см. foodgram.db_router)
+            token = self.get_model().objects.using('default').select_related(
+                'user',
+            ).defer(
+                *(f'user__{name}' for name in DEFERRED_FIELDS),
+            ).filter(key=key).first()
+            if token is None:
+                return None
+            cache.set(
+                cache_key(key), token,
+                getattr(settings, 'TOKEN_CACHE_TIMEOUT', 60),
+            )
+        local_set(key, token)
+        return token
+
+    def authenticate_credentials(self, key):
+        token = self.get_token(key)
+        if token is None:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        # у каждого запроса своя копия: объект в памяти процесса
+        # общий для всех потоков
+        token = copy.deepcopy(token)
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.'))
+        return (token.user, token)
@@ -0,0 +1,80 @@
+import hashlib
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Ingredient, Tag
+from recipes.versions import get_version
+
+from .serializers import IngredientSerializer, TagSerializer
+
+
+def strip_weak(etag):
+    """
+    If-None-Match сравнивается слабо (RFC 7232): прокси с gzip
+    отдает клиенту W/"..." вместо выданного ETag.
+    """
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+class Catalog:
+    """
+    Справочник, заранее отрендеренный в JSON.
+
+    Тело ответа и ETag хранятся в памяти процесса и пересобираются,
+    только когда меняется версия справочника (см. recipes.versions).
+    """
+
+    def __init__(self, name, queryset, serializer_class):
+        self.name = name
+        self.queryset = queryset
+        self.serializer_class = serializer_class
+        self._lock = threading.Lock()
+        self._cached = None
+
+    def render(self):
+        # с основной базы: справочник хранится до смены версии
+        # (см. foodgram.db_router)
+        data = self.serializer_class(
+            self.queryset.using('default'), many=True).data
+        body = JSONRenderer().render(data)
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        return etag, body
+
+    def get(self):
+        version = get_version(self.name)
+        cached = self._cached
+        if cached is None or cached[0] != version:
+            with self._lock:
+                if self._cached is None or self._cached[0] != version:
+                    self._cached = (version, *self.render())
+                cached = self._cached
+        return cached[1], cached[2]
+
+    def response(self, request):
+        """Ответ с ETag; 304, если у клиента актуальная копия."""
+        etag, body = self.get()
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match and (
+                if_none_match == '*'
+                or etag in map(strip_weak, parse_etags(if_none_match))):
+            response = HttpResponse(status=304)
+        else:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=getattr(settings, 'CATALOG_CACHE_MAX_AGE', 0),
+            must_revalidate=True,
+        )
+        return response
+
+
+ingredients_catalog = Catalog('ingredients', Ingredient.objects.order_by('pk'),
+                              IngredientSerializer)
+tags_catalog = Catalog('tags', Tag.objects.order_by('pk'), TagSerializer)
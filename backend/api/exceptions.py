@@ -48,3 +48,33 @@ class AlreadyInCart(APIException):
     status_code = status.HTTP_400_BAD_REQUEST
     default_detail = 'Уже в корзине.'
     default_code = 'errors'
+
+
+class UnknownFileFormat(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Неизвестный формат файла.'
+    default_code = 'errors'
+
+
+class InvalidIngredientFilter(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Ингридиенты передаются списком id.'
+    default_code = 'errors'
+
+
+class InvalidContentRange(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Неверный заголовок Content-Range.'
+    default_code = 'errors'
+
+
+class UploadOffsetMismatch(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Часть файла не совпадает с уже загруженной.'
+    default_code = 'errors'
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Файл слишком большой.'
+    default_code = 'errors'
@@ -0,0 +1,85 @@
+from django.db.models import Exists, OuterRef
+from django_filters import rest_framework as filters
+from rest_framework.exceptions import AuthenticationFailed
+
+from recipes.models import Recipe, UserFavoriteRecipes, UserShoppingCartRecipes
+
+from .exceptions import InvalidIngredientFilter
+
+
+def parse_ids(values):
+    """id из ['1,2', '3'] (?param=1,2&param=3)."""
+    try:
+        return [
+            int(value) for value in ','.join(values).split(',') if value
+        ]
+    except ValueError:
+        raise InvalidIngredientFilter
+
+
+class RecipeFilter(filters.FilterSet):
+    """
+    Фильтры списка рецептов.
+
+    Условия по связанным таблицам записаны полусоединениями (EXISTS
+    для тегов, IN по короткому списку пользователя для избранного
+    и корзины): фильтры сочетаются друг с другом без JOIN
+    с размножением строк и без DISTINCT по всей строке рецепта,
+    которые пришлось бы делать до пагинации.
+    """
+    tags = filters.CharFilter(method='filter_tags')
+    author = filters.NumberFilter(field_name='author_id')
+    is_favorited = filters.CharFilter(method='filter_user_recipes')
+    is_in_shopping_cart = filters.CharFilter(method='filter_user_recipes')
+    ingredients = filters.CharFilter(method='filter_ingredients')
+    exclude_ingredients = filters.CharFilter(method='filter_ingredients')
+    search = filters.CharFilter(method='filter_search')
+
+    USER_RECIPES = {
+        'is_favorited': UserFavoriteRecipes,
+        'is_in_shopping_cart': UserShoppingCartRecipes,
+    }
+
+    class Meta:
+        model = Recipe
+        fields = (
+            'tags',
+            'author',
+            'is_favorited',
+            'is_in_shopping_cart',
+            'ingredients',
+            'exclude_ingredients',
+            'search',
+        )
+
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов ?tags=a&tags=b (по slug)"""
+        return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag__slug__in=self.data.getlist(name),
+        )))
+
+    def filter_user_recipes(self, queryset, name, value):
+        """Рецепты из избранного или корзины текущего пользователя"""
+        if value != '1':
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            raise AuthenticationFailed(
+                detail="Доступно только авторизованным пользователем")
+        user_recipes = self.USER_RECIPES[name].objects.filter(user=user)
+        return queryset.filter(pk__in=user_recipes.values('recipe_id'))
+
+    def filter_ingredients(self, queryset, name, value):
+        """Наличие (ingredients) и отсутствие (exclude_ingredients)"""
+        ids = parse_ids(self.data.getlist(name))
+        if name == 'exclude_ingredients':
+            return queryset.with_ingredients(exclude=ids)
+        return queryset.with_ingredients(include=ids)
+
+    def filter_search(self, queryset, name, value):
+        """Полнотекстовый поиск по названию и описанию"""
+        value = value.strip()
+        if not value:
+            return queryset
+        return queryset.search(value)
@@ -0,0 +1,97 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import load_backend
+from django.test import Client
+from django.test.utils import override_settings
+
+from users.models import User
+
+# режим: изменения настроек основной базы
+MODES = (
+    ('connect', {
+        'CONN_MAX_AGE': 0,
+        'ENGINE': 'django.db.backends.postgresql',
+    }),
+    ('persistent', {
+        'CONN_MAX_AGE': 600,
+        'ENGINE': 'django.db.backends.postgresql',
+    }),
+    ('pool', {
+        'CONN_MAX_AGE': 0,
+        'ENGINE': 'foodgram.postgresql_pool',
+        'POOL': {'SIZE': 1},
+    }),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Задержка запроса к API при новом соединении с PostgreSQL '
+        'на каждый запрос, постоянном соединении (CONN_MAX_AGE) '
+        'и пуле соединений (foodgram.postgresql_pool)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Адрес запроса; по умолчанию — профиль пользователя',
+        )
+        parser.add_argument('--requests', type=int, default=200)
+
+    def handle(self, *args, **options):
+        original = connections[DEFAULT_DB_ALIAS]
+        if original.vendor != 'postgresql':
+            raise CommandError('Сравнение имеет смысл только для PostgreSQL')
+        path = options['path']
+        if path is None:
+            user = User.objects.order_by('pk').first()
+            if user is None:
+                raise CommandError(
+                    'Нет пользователей, запустите generate_data')
+            path = f'/api/users/{user.pk}/'
+        original.close()
+        self.stdout.write(
+            f'{"mode":<12}{"median, ms":>12}{"p95, ms":>10}{"saved, ms":>11}')
+        baseline = None
+        try:
+            # все чтения — с основной базы (см. foodgram.db_router)
+            with override_settings(DATABASE_REPLICAS=[]):
+                for name, overrides in MODES:
+                    timings = self.run_mode(path, overrides, options)
+                    median = statistics.median(timings)
+                    p95 = timings[int(len(timings) * 0.95) - 1]
+                    if baseline is None:
+                        baseline = median
+                    self.stdout.write(
+                        f'{name:<12}{median:>12.2f}{p95:>10.2f}'
+                        f'{baseline - median:>11.2f}')
+        finally:
+            connections[DEFAULT_DB_ALIAS] = original
+        from foodgram.postgresql_pool.base import pool_stats
+        for database, stats in pool_stats().items():
+            self.stdout.write(f'Пул {database}: {stats}')
+
+    @staticmethod
+    def run_mode(path, overrides, options):
+        """Время каждого запроса, отсортированное; первый не считается."""
+        settings_dict = {**settings.DATABASES[DEFAULT_DB_ALIAS], **overrides}
+        wrapper = load_backend(settings_dict['ENGINE']).DatabaseWrapper(
+            settings_dict, DEFAULT_DB_ALIAS)
+        connections[DEFAULT_DB_ALIAS] = wrapper
+        client = Client()
+        try:
+            client.get(path)
+            timings = []
+            for _ in range(options['requests']):
+                start = time.perf_counter()
+                response = client.get(path)
+                timings.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    raise CommandError(f'{path}: {response.status_code}')
+        finally:
+            wrapper.close()
+        return sorted(timings)
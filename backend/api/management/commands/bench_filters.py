@@ -0,0 +1,85 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.http import QueryDict
+from django.test import RequestFactory
+
+from api.filters import RecipeFilter
+from api.views import RecipeViewSet
+from recipes.models import Recipe, Tag
+from users.models import User
+
+
+def join_queryset(queryset, user, params):
+    """Фильтрация, как до RecipeFilter: JOIN по связям и DISTINCT."""
+    tags = params.getlist('tags')
+    if tags:
+        queryset = queryset.filter(tags__slug__in=tags).distinct()
+    if 'author' in params:
+        queryset = queryset.filter(author=params['author'])
+    if params.get('is_favorited') == '1':
+        queryset = queryset.filter(users_favorite__user=user)
+    if params.get('is_in_shopping_cart') == '1':
+        queryset = queryset.filter(users_shopping__user=user)
+    return queryset
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение фильтров списка рецептов через JOIN с DISTINCT '
+        'и через полусоединения RecipeFilter. Запускать на базе, '
+        'заполненной generate_data'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        user = User.objects.annotate(
+            favorites=Count('recipe_favorite')).order_by('-favorites').first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        author = Recipe.objects.values_list('author_id', flat=True).first()
+        if user is None or len(tags) < 2 or author is None:
+            raise CommandError(
+                'Недостаточно данных, запустите generate_data')
+        request = RequestFactory().get('/api/recipes/')
+        request.user = user
+        cases = (
+            ('tags', f'tags={tags[0]}'),
+            ('tags x2', f'tags={tags[0]}&tags={tags[1]}'),
+            ('tags + author', f'tags={tags[0]}&author={author}'),
+            ('tags + favorited', f'tags={tags[0]}&is_favorited=1'),
+            ('favorited + cart', 'is_favorited=1&is_in_shopping_cart=1'),
+        )
+        self.stdout.write(
+            f'{"filter":<20}{"rows":>8}{"join, ms":>12}{"filter, ms":>12}')
+        for name, query in cases:
+            params = QueryDict(query)
+            base = Recipe.objects.for_read(user).order_by(
+                *RecipeViewSet.recipe_ordering)
+            joined = join_queryset(base, user, params)
+            filtered = RecipeFilter(params, base, request=request).qs
+            rows = joined.count()
+            if rows != filtered.count():
+                raise CommandError(f'{name}: результаты не совпадают')
+            join_ms = self.measure(joined, options)
+            filtered_ms = self.measure(filtered, options)
+            self.stdout.write(
+                f'{name:<20}{rows:>8}{join_ms:>12.2f}{filtered_ms:>12.2f}')
+
+    @staticmethod
+    def measure(queryset, options):
+        """
+        Медиана времени первой страницы: COUNT(*) и строки страницы,
+        как у постраничной пагинации.
+        """
+        timings = []
+        for _ in range(options['repeat']):
+            start = time.perf_counter()
+            queryset.all().count()
+            list(queryset.all()[:options['limit']])
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
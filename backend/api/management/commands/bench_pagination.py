@@ -0,0 +1,81 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from api.paginators import PagePagination
+from api.views import RecipeViewSet
+from recipes.models import Recipe
+
+# без кеша: иначе после первого запроса ответ и COUNT(*) берутся
+# из кеша (api.response_cache, api.paginators) на любой глубине
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение постраничной и keyset-пагинации списка рецептов '
+        'на разной глубине, без кеша ответов и числа объектов. '
+        'Запускать на базе, заполненной generate_data'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--depths', type=int, nargs='+',
+            default=[1, 10, 100, 1000, 10000],
+            help='Номера страниц для замера',
+        )
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        total = Recipe.objects.count()
+        depths = [
+            depth for depth in options['depths']
+            if (depth - 1) * limit < total
+        ]
+        if not depths:
+            raise CommandError(
+                'Недостаточно рецептов, запустите generate_data')
+        client = APIClient()
+        paginator = PagePagination()
+        paginator.ordering = RecipeViewSet.recipe_ordering
+
+        self.stdout.write(
+            f'{"page":>8}{"page, ms":>12}{"queries":>9}'
+            f'{"cursor, ms":>12}{"queries":>9}'
+        )
+        for depth in depths:
+            page_url = f'/api/recipes/?limit={limit}&page={depth}'
+            cursor_url = f'/api/recipes/?limit={limit}&cursor='
+            if depth > 1:
+                last = Recipe.objects.order_by(
+                    *paginator.ordering)[(depth - 1) * limit - 1]
+                cursor_url += paginator.encode_position(last)
+            with override_settings(CACHES=NO_CACHE):
+                page_ms, page_queries = self.measure(
+                    client, page_url, options['repeat'])
+                cursor_ms, cursor_queries = self.measure(
+                    client, cursor_url, options['repeat'])
+            self.stdout.write(
+                f'{depth:>8}{page_ms:>12.2f}{page_queries:>9}'
+                f'{cursor_ms:>12.2f}{cursor_queries:>9}'
+            )
+
+    def measure(self, client, url, repeat):
+        """Медиана времени ответа и число запросов к базе."""
+        timings = []
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise CommandError(f'{url}: {response.status_code}')
+        return statistics.median(timings), len(queries)
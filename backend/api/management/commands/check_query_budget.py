@@ -0,0 +1,627 @@
+import base64
+import random
+import tempfile
+import time
+from urllib.parse import quote
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.authentication import CachedTokenAuthentication, invalidate_tokens
+from recipes.cart import rebuild_shopping_lists
+from recipes.models import (
+    ImageUpload,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    Tag,
+    UserFavoriteRecipes,
+    UserShoppingCartRecipes,
+)
+from recipes.transfer import export_recipes, to_ndjson
+from users.models import Subscribe, User
+
+PAGE_LIMIT = 10
+# второй размер страницы: число запросов списка от него не зависит
+PAGE_LIMIT_2 = 25
+
+# состояние кеша перед измеряемым запросом
+COLD = 'cold'  # кеш очищен
+WARM = 'warm'  # тот же запрос уже сделан
+
+# клиент строки: False — аноним, True — пользователь, ADMIN — staff
+ADMIN = 'admin'
+USER_LABELS = {False: 'anon', True: 'auth', ADMIN: 'admin'}
+
+# (название, метод, url, клиент, статус ответа, бюджет запросов,
+# состояние кеша)
+# Перед каждой строкой кеш Django очищается, а кеши в памяти процесса
+# (справочники, индекс ингридиентов, избранное и корзина) устаревают
+# вместе с версиями (recipes.versions), поэтому бюджет не зависит от
+# порядка строк. Токены клиентов снова кладутся в кеш
+# (api.authentication). Для WARM перед измерением делается такой же
+# запрос. Списки с {limit} проверяются на страницах PAGE_LIMIT и
+# PAGE_LIMIT_2: число запросов должно совпасть. Записи меняют базу,
+# поэтому пары добавление/удаление идут подряд.
+ROUTES = (
+    ('users-create', 'post', '/api/users/', False, 200, 6, COLD),
+    ('users-list', 'get', '/api/users/?limit={limit}', False, 200, 2, COLD),
+    ('users-list', 'get', '/api/users/?limit={limit}', True, 200, 2, COLD),
+    ('users-detail', 'get', '/api/users/{author}/', False, 200, 1, COLD),
+    ('users-detail', 'get', '/api/users/{author}/', True, 200, 2, COLD),
+    ('users-me', 'get', '/api/users/me/', True, 200, 2, COLD),
+    ('users-subscriptions', 'get',
+     '/api/users/subscriptions/?limit={limit}&recipes_limit=3',
+     False, 401, 0, COLD),
+    ('users-subscriptions', 'get',
+     '/api/users/subscriptions/?limit={limit}&recipes_limit=3',
+     True, 200, 3, COLD),
+    ('users-subscriptions-no-limit', 'get',
+     '/api/users/subscriptions/?limit={limit}', True, 200, 3, COLD),
+    # записи в избранное, корзину и подписки обновляют счетчики
+    ('users-subscribe', 'post', '/api/users/{stranger}/subscribe/',
+     True, 201, 5, COLD),
+    ('users-subscribe', 'delete', '/api/users/{stranger}/subscribe/',
+     True, 204, 5, COLD),
+    # авторизованному на холодном кеше — еще запрос его избранного
+    # и корзины (recipes.memberships)
+    ('recipes-list', 'get', '/api/recipes/?limit={limit}',
+     False, 200, 5, COLD),
+    ('recipes-list', 'get', '/api/recipes/?limit={limit}',
+     True, 200, 6, COLD),
+    # ответ из кеша (api.response_cache); авторизованному
+    # флаги избранного и корзины берутся из памяти процесса
+    ('recipes-list', 'get', '/api/recipes/?limit={limit}',
+     False, 200, 0, WARM),
+    ('recipes-list', 'get', '/api/recipes/?limit={limit}',
+     True, 200, 0, WARM),
+    ('recipes-list-cursor', 'get', '/api/recipes/?limit={limit}&cursor=',
+     False, 200, 4, COLD),
+    ('recipes-list-cursor', 'get', '/api/recipes/?limit={limit}&cursor=',
+     True, 200, 5, COLD),
+    ('recipes-list-tags', 'get',
+     '/api/recipes/?limit={limit}&tags={tag_slug}&tags={tag_slug_2}',
+     False, 200, 5, COLD),
+    ('recipes-list-tags', 'get',
+     '/api/recipes/?limit={limit}&tags={tag_slug}&tags={tag_slug_2}',
+     True, 200, 6, COLD),
+    ('recipes-list-author', 'get',
+     '/api/recipes/?limit={limit}&author={author}', False, 200, 5, COLD),
+    ('recipes-list-author', 'get',
+     '/api/recipes/?limit={limit}&author={author}', True, 200, 6, COLD),
+    ('recipes-list-ingredients', 'get',
+     '/api/recipes/?limit={limit}&ingredients={ingredient}'
+     '&exclude_ingredients={ingredient_2}', False, 200, 5, COLD),
+    ('recipes-list-ingredients', 'get',
+     '/api/recipes/?limit={limit}&ingredients={ingredient}'
+     '&exclude_ingredients={ingredient_2}', True, 200, 6, COLD),
+    ('recipes-search', 'get', '/api/recipes/?limit={limit}&search={search_q}',
+     False, 200, 5, COLD),
+    ('recipes-search', 'get', '/api/recipes/?limit={limit}&search={search_q}',
+     True, 200, 6, COLD),
+    ('recipes-list-favorited', 'get',
+     '/api/recipes/?limit={limit}&is_favorited=1', True, 200, 6, COLD),
+    ('recipes-list-in-cart', 'get',
+     '/api/recipes/?limit={limit}&is_in_shopping_cart=1',
+     True, 200, 6, COLD),
+    ('recipes-detail', 'get', '/api/recipes/{recipe}/', False, 200, 4, COLD),
+    ('recipes-detail', 'get', '/api/recipes/{recipe}/', True, 200, 5, COLD),
+    ('recipes-favorite', 'post', '/api/recipes/{recipe}/favorite/',
+     True, 201, 6, COLD),
+    ('recipes-favorite', 'delete', '/api/recipes/{recipe}/favorite/',
+     True, 204, 5, COLD),
+    # запись в корзину пересчитывает строки списка покупок: добавление —
+    # один INSERT ... ON CONFLICT, удаление — SELECT FOR UPDATE, UPDATE
+    # оставшихся и DELETE обнулившихся позиций
+    ('recipes-shopping-cart', 'post',
+     '/api/recipes/{recipe}/shopping_cart/', True, 201, 14, COLD),
+    ('recipes-shopping-cart', 'delete',
+     '/api/recipes/{recipe}/shopping_cart/', True, 204, 9, COLD),
+    ('recipes-download-shopping-cart', 'get',
+     '/api/recipes/download_shopping_cart/', False, 401, 0, COLD),
+    ('recipes-download-shopping-cart', 'get',
+     '/api/recipes/download_shopping_cart/', True, 200, 1, COLD),
+    ('recipes-download-shopping-cart-csv', 'get',
+     '/api/recipes/download_shopping_cart/?file_format=csv',
+     True, 200, 1, COLD),
+    ('recipes-download-shopping-cart-pdf', 'get',
+     '/api/recipes/download_shopping_cart/?file_format=pdf',
+     True, 200, 1, COLD),
+    # состав рецепта из RECIPE_SIZE ингридиентов меняется по разнице
+    # с текущим, а не удалением и вставкой всех строк; удаляемые строки
+    # выбираются перед DELETE ради сигнала сброса кеша ответов; рецепт
+    # в корзине, и его список покупок меняется в обе стороны
+    ('recipes-update', 'patch', '/api/recipes/{own_recipe}/',
+     True, 200, 22, COLD),
+    ('recipes-update-unchanged', 'patch', '/api/recipes/{own_recipe}/',
+     True, 200, 13, COLD),
+    # ингридиенты рецепта вставляются одним bulk_create; удаление
+    # рецепта из корзины пересчитывает список покупок
+    ('recipes-create', 'post', '/api/recipes/', True, 201, 16, COLD),
+    ('recipes-delete', 'delete', '/api/recipes/{own_recipe_2}/',
+     True, 204, 17, COLD),
+    # выгрузка читает рецепты пачками по EXPORT_CHUNK_SIZE, загрузка
+    # пишет пачками по IMPORT_BATCH_SIZE (recipes.transfer): бюджет
+    # на одну пачку
+    ('recipes-export', 'get', '/api/recipes/export/', True, 403, 0, COLD),
+    ('recipes-export', 'get', '/api/recipes/export/', ADMIN, 200, 3, COLD),
+    ('recipes-import', 'post', '/api/recipes/import/', ADMIN, 200, 12,
+     COLD),
+    # часть загрузки пишется под SELECT FOR UPDATE строки загрузки
+    ('uploads-create', 'post', '/api/uploads/', True, 201, 1, COLD),
+    ('uploads-create-file', 'post', '/api/uploads/', True, 201, 1, COLD),
+    ('uploads-update', 'put', '/api/uploads/{upload}/', True, 200, 3, COLD),
+    ('uploads-detail', 'get', '/api/uploads/{upload}/', True, 200, 1, COLD),
+    ('uploads-delete', 'delete', '/api/uploads/{upload}/',
+     True, 204, 2, COLD),
+    # справочники рендерятся один раз, дальше отдаются из памяти
+    ('ingredients-list', 'get', '/api/ingredients/', False, 200, 1, COLD),
+    ('ingredients-list', 'get', '/api/ingredients/', True, 200, 0, WARM),
+    # первый поиск строит индекс в памяти, дальше запросов нет
+    ('ingredients-search', 'get', '/api/ingredients/?name={ingredient_q}',
+     False, 200, 1, COLD),
+    ('ingredients-search', 'get', '/api/ingredients/?name={ingredient_q}',
+     True, 200, 0, WARM),
+    ('ingredients-detail', 'get', '/api/ingredients/{ingredient}/',
+     False, 200, 1, COLD),
+    ('ingredients-detail', 'get', '/api/ingredients/{ingredient}/',
+     True, 200, 1, COLD),
+    ('tags-list', 'get', '/api/tags/', False, 200, 1, COLD),
+    ('tags-list', 'get', '/api/tags/', True, 200, 0, WARM),
+    ('tags-detail', 'get', '/api/tags/{tag}/', False, 200, 1, COLD),
+    ('tags-detail', 'get', '/api/tags/{tag}/', True, 200, 1, COLD),
+)
+
+# Путь чтения рецептов (RecipeQuerySet.for_read и with_related):
+# (название, маленький ответ, большой ответ, пользователи).
+# Число запросов не должно зависеть от размера ответа — числа
+# рецептов на странице, рецептов автора в подписках, ингридиентов
+# и тегов рецепта.
+SIZE_CHECKS = (
+    ('recipes-list', '/api/recipes/?limit=1', '/api/recipes/?limit=50',
+     (False, True)),
+    ('recipes-detail', '/api/recipes/{recipe}/', '/api/recipes/{own_recipe}/',
+     (False, True)),
+    ('users-subscriptions',
+     '/api/users/subscriptions/?limit=1&recipes_limit=1',
+     '/api/users/subscriptions/?limit=50&recipes_limit=10', (True,)),
+)
+
+# (название, отфильтрованный список, запись, добавляющая в него рецепт)
+COUNT_CHECKS = (
+    ('recipes-list-favorited', '/api/recipes/?limit={limit}&is_favorited=1',
+     '/api/recipes/{recipe}/favorite/'),
+    ('recipes-list-in-cart',
+     '/api/recipes/?limit={limit}&is_in_shopping_cart=1',
+     '/api/recipes/{recipe}/shopping_cart/'),
+)
+
+# свой кеш команды: очистка не задевает общий кеш из настроек
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'check_query_budget',
+    }
+}
+
+RECIPE_SIZE = 30
+
+# картинка 1x1 для рецептов и загрузок
+IMAGE = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhf'
+    'DwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+
+
+def recipe_data(params):
+    """
+    Новый состав своего рецепта: часть ингридиентов с другим
+    количеством, часть удалена, часть добавлена.
+    """
+    ingredient_ids = params['ingredient_ids']
+    return {
+        'name': 'Рецепт',
+        'text': 'Описание рецепта.',
+        'cooking_time': 10,
+        'tags': [params['tag']],
+        'ingredients': [
+            {'id': pk, 'amount': 2}
+            for pk in ingredient_ids[5:RECIPE_SIZE + 5]
+        ],
+    }
+
+
+def recipe_payload(params):
+    return {'data': recipe_data(params), 'format': 'json'}
+
+
+def recipe_create_payload(params):
+    data = recipe_data(params)
+    data['image'] = 'data:image/png;base64,' + base64.b64encode(
+        IMAGE).decode()
+    return {'data': data, 'format': 'json'}
+
+
+def user_payload(params):
+    return {
+        'data': {
+            'username': 'budget-user',
+            'email': 'budget-user@foodgram.local',
+            'first_name': 'Имя',
+            'last_name': 'Фамилия',
+            'password': 'budget-password',
+        },
+        'format': 'json',
+    }
+
+
+def upload_payload(params):
+    return {
+        'data': {'filename': 'photo.png', 'total_size': len(IMAGE)},
+        'format': 'json',
+    }
+
+
+def upload_file_payload(params):
+    return {
+        'data': {'file': SimpleUploadedFile('photo.png', IMAGE)},
+        'format': 'multipart',
+    }
+
+
+def chunk_payload(params):
+    """Весь файл одной частью загрузки params['upload']."""
+    return {
+        'data': IMAGE,
+        'content_type': 'application/octet-stream',
+        'HTTP_CONTENT_RANGE': f'bytes 0-{len(IMAGE) - 1}/{len(IMAGE)}',
+    }
+
+
+def import_payload(params):
+    return {
+        'data': params['import_body'],
+        'content_type': 'application/x-ndjson',
+    }
+
+
+# аргументы запросов на запись по названию маршрута
+PAYLOADS = {
+    'users-create': user_payload,
+    'recipes-create': recipe_create_payload,
+    'recipes-update': recipe_payload,
+    'recipes-update-unchanged': recipe_payload,
+    'recipes-import': import_payload,
+    'uploads-create': upload_payload,
+    'uploads-create-file': upload_file_payload,
+    'uploads-update': chunk_payload,
+}
+
+
+def seed(users, recipes, seed_value):
+    """
+    Наполняет базу реалистичным набором данных
+    и возвращает пользователя, от имени которого идут запросы.
+    """
+    rnd = random.Random(seed_value)
+    default_storage.save('recipes/temp.png', ContentFile(IMAGE))
+    Tag.objects.bulk_create([
+        Tag(name=name, color=color, slug=slug)
+        for name, color, slug in (
+            ('Завтрак', '#008000', 'breakfast'),
+            ('Обед', '#ffff00', 'lunch'),
+            ('Ужин', '#ff0000', 'dinner'),
+        )
+    ])
+    tags = list(Tag.objects.all())
+    Ingredient.objects.bulk_create([
+        Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+        for i in range(200)
+    ])
+    ingredients = list(Ingredient.objects.all())
+    User.objects.bulk_create([
+        User(
+            username=f'user{i}',
+            email=f'user{i}@foodgram.local',
+            first_name='Имя',
+            last_name='Фамилия',
+            password='!',
+        )
+        for i in range(users)
+    ])
+    authors = list(User.objects.all())
+    Recipe.objects.bulk_create([
+        Recipe(
+            author=rnd.choice(authors),
+            name=f'Рецепт {i}',
+            text='Описание рецепта. ' * 20,
+            cooking_time=rnd.randint(1, 120),
+            image='recipes/temp.png',
+        )
+        for i in range(recipes)
+    ])
+    all_recipes = list(Recipe.objects.all())
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe=recipe, tag=tag)
+        for recipe in all_recipes
+        for tag in rnd.sample(tags, rnd.randint(1, len(tags)))
+    ])
+    IngredientRecipe.objects.bulk_create([
+        IngredientRecipe(recipe=recipe, ingredient=ingredient,
+                         amount=rnd.randint(1, 500))
+        for recipe in all_recipes
+        for ingredient in rnd.sample(ingredients, rnd.randint(3, 12))
+    ])
+    user = authors[0]
+    user.set_password('budget-password')
+    user.save()
+    following = authors[1:PAGE_LIMIT * 2]
+    Subscribe.objects.bulk_create([
+        Subscribe(follower=user, following=author) for author in following
+    ])
+    UserFavoriteRecipes.objects.bulk_create([
+        UserFavoriteRecipes(user=user, recipe=recipe)
+        for recipe in all_recipes[1:PAGE_LIMIT * 2]
+    ])
+    UserShoppingCartRecipes.objects.bulk_create([
+        UserShoppingCartRecipes(user=user, recipe=recipe)
+        for recipe in all_recipes[1:PAGE_LIMIT * 2]
+    ])
+    # второй рецепт — для удаления
+    for name in ('Свой рецепт', 'Свой рецепт 2'):
+        own_recipe = Recipe.objects.create(
+            author=user,
+            name=name,
+            text='Описание рецепта.',
+            cooking_time=10,
+            image='recipes/temp.png',
+        )
+        own_recipe.tags.set(tags[:1])
+        IngredientRecipe.objects.bulk_create([
+            IngredientRecipe(
+                recipe=own_recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients[:RECIPE_SIZE]
+        ])
+        UserShoppingCartRecipes.objects.create(user=user, recipe=own_recipe)
+    ImageUpload.objects.create(
+        user=user, filename='photo.png', total_size=len(IMAGE))
+    User.objects.create_user(
+        username='admin',
+        email='admin@foodgram.local',
+        first_name='Имя',
+        last_name='Фамилия',
+        password='budget-password',
+        is_staff=True,
+    )
+    # корзина выше наполнена bulk_create, без сигналов
+    rebuild_shopping_lists()
+    return user
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверка числа SQL-запросов каждого эндпоинта API '
+        'на тестовой базе с синтетическими данными'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=300)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--keepdb',
+            action='store_true',
+            help='Не удалять тестовую базу после проверки',
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            # запросы считаются на основной базе, реплики не создаются;
+            # кеш очищается перед каждой строкой, поэтому он свой,
+            # а не общий кеш из настроек; картинки и загрузки пишутся
+            # во временный каталог
+            with tempfile.TemporaryDirectory() as media, override_settings(
+                DATABASE_REPLICAS=[],
+                CACHES=CACHES,
+                MEDIA_ROOT=media,
+                IMAGE_UPLOAD_DIR=f'{media}/uploads',
+            ):
+                failures = self.check_routes(options)
+        finally:
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        if failures:
+            raise CommandError(
+                'Превышен бюджет запросов: ' + ', '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Бюджет запросов соблюден'))
+
+    def check_routes(self, options):
+        user = seed(options['users'], options['recipes'], options['seed'])
+        params = route_params(user)
+        clients = {False: APIClient()}
+        tokens = []
+        for auth, client_user in (
+            (True, user), (ADMIN, User.objects.get(is_staff=True)),
+        ):
+            token = Token.objects.create(user=client_user).key
+            clients[auth] = APIClient()
+            clients[auth].credentials(HTTP_AUTHORIZATION=f'Token {token}')
+            tokens.append(token)
+
+        failures = []
+        self.stdout.write(
+            f'{"route":<40}{"user":<6}{"cache":<6}{"limit":>6}'
+            f'{"status":>7}{"queries":>9}{"budget":>8}'
+            f'{"db, ms":>9}{"wall, ms":>10}'
+        )
+        for name, method, url, auth, status, budget, state in ROUTES:
+            label = f'{method.upper()} {name} ({USER_LABELS[auth]})'
+            limits = (
+                (PAGE_LIMIT, PAGE_LIMIT_2) if '{limit}' in url else ('-',))
+            counts = []
+            for limit in limits:
+                reset_caches(tokens)
+                request = (
+                    clients[auth], method,
+                    url.format(**params, limit=limit),
+                    PAYLOADS.get(name), params,
+                )
+                if state == WARM:
+                    measure(*request)
+                response, queries, db_time, wall = measure(*request)
+                counts.append(queries)
+                line = (
+                    f'{method.upper() + " " + name:<40}'
+                    f'{USER_LABELS[auth]:<6}{state:<6}{limit:>6}'
+                    f'{response.status_code:>7}{queries:>9}{budget:>8}'
+                    f'{db_time:>9.1f}{wall:>10.1f}'
+                )
+                errors = []
+                if response.status_code != status:
+                    errors.append(
+                        f'{label}: статус {response.status_code} != {status}')
+                if queries > budget:
+                    errors.append(f'{label}: {queries} > {budget}')
+                failures.extend(errors)
+                self.stdout.write(
+                    self.style.ERROR(line) if errors else line)
+            if len(set(counts)) > 1:
+                failures.append(
+                    f'{label}: число запросов зависит от limit {counts}')
+        failures.extend(self.check_sizes(clients, tokens, params))
+        failures.extend(self.check_counts(clients[True], tokens, params))
+        return failures
+
+    def check_counts(self, client, tokens, params):
+        """
+        count отфильтрованного списка меняется сразу после записи
+        в таблицу подзапроса фильтра, а не по истечении
+        PAGINATION_COUNT_CACHE_TIMEOUT (см. api.paginators).
+        """
+        failures = []
+        self.stdout.write(f'\n{"filtered count":<40}{"before / after":>22}')
+        for name, url, path in COUNT_CHECKS:
+            reset_caches(tokens)
+            url = url.format(limit=PAGE_LIMIT)
+            path = path.format(**params)
+            before = client.get(url).data['count']
+            client.post(path)
+            response = client.get(url)
+            after = response.data['count']
+            client.delete(path)
+            line = f'{"GET " + name:<40}{f"{before} / {after}":>22}'
+            if after != before + 1 or len(response.data['results']) != min(
+                    after, PAGE_LIMIT):
+                failures.append(
+                    f'GET {name}: count {after} после записи, '
+                    f'ожидалось {before + 1}')
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        return failures
+
+    def check_sizes(self, clients, tokens, params):
+        """Сравнивает число запросов маленького и большого ответа."""
+        failures = []
+        self.stdout.write(f'\n{"read path":<40}{"user":<6}{"queries":>16}')
+        for name, small, large, users in SIZE_CHECKS:
+            for auth in users:
+                counts = []
+                for url in (small, large):
+                    reset_caches(tokens)
+                    response, queries, _, _ = measure(
+                        clients[auth], 'get', url.format(**params),
+                        None, params)
+                    if response.status_code != 200:
+                        failures.append(
+                            f'{url}: статус {response.status_code}')
+                    counts.append(queries)
+                line = (
+                    f'{"GET " + name:<40}{USER_LABELS[auth]:<6}'
+                    f'{" / ".join(map(str, counts)):>16}'
+                )
+                if counts[0] != counts[1]:
+                    failures.append(
+                        f'GET {name} ({USER_LABELS[auth]}): '
+                        f'число запросов зависит от размера ответа {counts}')
+                    line = self.style.ERROR(line)
+                self.stdout.write(line)
+        return failures
+
+
+def route_params(user):
+    """Значения для подстановки в url маршрутов."""
+    recipe = Recipe.objects.exclude(
+        users_favorite__user=user).exclude(
+        users_shopping__user=user).first()
+    tags = list(Tag.objects.all())
+    ingredient, ingredient_2 = Ingredient.objects.order_by('pk')[:2]
+    # два последних рецепта пользователя созданы в seed
+    own_recipe_2, own_recipe = Recipe.objects.filter(
+        author=user).order_by('-pk')[:2]
+    # свой рецепт под другим названием, в NDJSON выгрузки
+    record, = export_recipes(Recipe.objects.filter(pk=own_recipe.pk))
+    record['name'] = 'Импортированный рецепт'
+    return {
+        'author': recipe.author_id,
+        'stranger': User.objects.exclude(
+            follower__follower=user).exclude(pk=user.pk).first().pk,
+        'recipe': recipe.pk,
+        'ingredient': ingredient.pk,
+        'ingredient_2': ingredient_2.pk,
+        'ingredient_q': ingredient.name[:3],
+        'search_q': quote('рецепт описание'),
+        'tag': tags[0].pk,
+        'tag_slug': tags[0].slug,
+        'tag_slug_2': tags[1].slug,
+        'own_recipe': own_recipe.pk,
+        'own_recipe_2': own_recipe_2.pk,
+        'upload': ImageUpload.objects.get(user=user).token,
+        'import_body': ''.join(to_ndjson([record])).encode(),
+        'ingredient_ids': list(
+            Ingredient.objects.order_by('pk').values_list('pk', flat=True)),
+    }
+
+
+def reset_caches(tokens):
+    """
+    Очищает кеш перед строкой и снова кладет в него
+    токены авторизованных клиентов.
+    """
+    cache.clear()
+    invalidate_tokens(tokens)
+    for token in tokens:
+        CachedTokenAuthentication().get_token(token)
+
+
+def measure(client, method, url, payload, params):
+    """Ответ, число запросов, время в базе и общее время, мс."""
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        if payload is None:
+            response = getattr(client, method)(url)
+        else:
+            response = getattr(client, method)(url, **payload(params))
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        wall = (time.perf_counter() - start) * 1000
+    db_time = sum(
+        float(query['time']) for query in queries.captured_queries
+    ) * 1000
+    return response, len(queries), db_time, wall
@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.uploads import delete_upload
+from recipes.models import ImageUpload
+
+
+class Command(BaseCommand):
+    help = 'Удаление незавершенных и неиспользованных загрузок картинок'
+
+    def handle(self, *args, **options):
+        expired = timezone.now() - timedelta(
+            hours=settings.IMAGE_UPLOAD_EXPIRE_HOURS)
+        deleted = 0
+        for upload in ImageUpload.objects.filter(created__lt=expired):
+            delete_upload(upload)
+            deleted += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено загрузок: {deleted}'))
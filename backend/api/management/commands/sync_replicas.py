@@ -0,0 +1,50 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Имитация репликации для локальной проверки foodgram.db_router: '
+        'копирует базу SQLite default в файлы реплик DATABASE_REPLICAS'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0,
+            help='Повторять копирование с этой паузой в секундах '
+                 '(отставание реплик); по умолчанию — один раз',
+        )
+
+    def handle(self, *args, **options):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        if not replicas:
+            raise CommandError('Реплики не настроены (DB_REPLICA_NAMES)')
+        for alias in ('default', *replicas):
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(
+                    f'{alias}: имитация только для SQLite, реплики '
+                    'PostgreSQL настраиваются потоковой репликацией')
+        while True:
+            self.sync(replicas)
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def sync(self, replicas):
+        source = sqlite3.connect(settings.DATABASES['default']['NAME'])
+        try:
+            for alias in replicas:
+                target = sqlite3.connect(settings.DATABASES[alias]['NAME'])
+                try:
+                    source.backup(target)
+                finally:
+                    target.close()
+        finally:
+            source.close()
+        self.stdout.write(f'Реплики обновлены: {", ".join(replicas)}')
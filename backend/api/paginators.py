@@ -1,7 +1,255 @@
+import base64
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.db.models.lookups import Lookup
+from django.db.models.sql import Query
+from django.db.models.sql.where import WhereNode
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from foodgram.db_router import cache_timeout
+from recipes.versions import get_versions
+
+
+def estimate_count(queryset):
+    """
+    Оценка числа строк по плану запроса PostgreSQL.
+    На других базах возвращает None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+def query_tables(query):
+    """
+    Таблицы, от которых зависит результат запроса: из FROM и JOIN,
+    из подзапросов в условиях и аннотациях (pk__in, Exists, Subquery)
+    и объявленные через recipes.versions.depends_on.
+    """
+    tables = {alias.table_name for alias in query.alias_map.values()}
+    tables.update(query.extra_tables)
+    tables.update(getattr(query, 'version_tables', ()))
+    nodes = [query.where, *query.annotations.values()]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, Query):
+            tables.update(query_tables(node))
+        elif isinstance(node, WhereNode):
+            nodes.extend(node.children)
+        elif isinstance(node, Lookup):
+            nodes.extend((node.lhs, node.rhs))
+        elif hasattr(node, 'get_source_expressions'):
+            nodes.extend(node.get_source_expressions())
+    return tables
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator, который не считает COUNT(*) на каждый запрос.
+
+    Число объектов кешируется на PAGINATION_COUNT_CACHE_TIMEOUT секунд
+    по SQL-запросу выборки и версиям его таблиц, включая таблицы
+    подзапросов фильтров (см. query_tables), которые меняются
+    при записи через ORM (см. api.signals). На PostgreSQL, если
+    планировщик оценивает выборку больше чем в
+    PAGINATION_ESTIMATE_THRESHOLD строк, вместо точного COUNT(*)
+    используется оценка.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not isinstance(queryset, QuerySet):
+            return super().count
+        queryset = queryset.order_by().values('pk')
+        try:
+            sql = str(queryset.query)
+        except EmptyResultSet:
+            return 0
+        tables = sorted(query_tables(queryset.query))
+        versions = get_versions(f'table:{table}' for table in tables)
+        key = 'pagination:count:' + hashlib.md5(
+            f'{sql}{versions}'.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            threshold = getattr(
+                settings, 'PAGINATION_ESTIMATE_THRESHOLD', None)
+            if threshold is not None:
+                estimate = estimate_count(queryset)
+                if estimate is not None and estimate >= threshold:
+                    count = estimate
+            if count is None:
+                count = queryset.count()
+            cache.set(key, count, cache_timeout(
+                getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 30)))
+        return count
 
 
 class PagePagination(PageNumberPagination):
-    """Пагинатор"""
+    """
+    Пагинатор.
+
+    По умолчанию постраничный. С параметром ?cursor= (для первой
+    страницы — пустым) переключается на keyset-пагинацию по полям
+    view.cursor_ordering: без COUNT(*) и OFFSET, поэтому время ответа
+    не зависит от глубины страницы.
+
+    Число объектов в постраничном режиме берется из кеша
+    (см. CachedCountPaginator), а с ?count=0 не считается вовсе.
+    """
+    django_paginator_class = CachedCountPaginator
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = (
+            self.cursor_query_param in request.query_params
+            and getattr(view, 'cursor_ordering', None) is not None
+        )
+        self.skip_count = (
+            not self.cursor_mode
+            and request.query_params.get(self.count_query_param)
+            in ('0', 'false')
+        )
+        if self.skip_count:
+            return self.paginate_without_count(queryset, request)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.ordering = view.cursor_ordering
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = request.query_params.get(self.cursor_query_param)
+        if position:
+            queryset = queryset.filter(
+                self.after_position(queryset.model, position))
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def paginate_without_count(self, queryset, request):
+        """Страница по OFFSET без COUNT(*): наличие следующей
+        определяется по лишней строке в выборке."""
+        self.request = request
+        page_size = self.get_page_size(request)
+        try:
+            self.page_number = int(
+                request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            raise NotFound('Неверная страница.')
+        if self.page_number < 1:
+            raise NotFound('Неверная страница.')
+        offset = (self.page_number - 1) * page_size
+        page = list(queryset[offset:offset + page_size + 1])
+        if not page and self.page_number > 1:
+            raise NotFound('Неверная страница.')
+        self.has_next = len(page) > page_size
+        return page[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.skip_count:
+            return Response(OrderedDict([
+                ('count', None),
+                ('next', self.get_next_link()),
+                ('previous', self.get_previous_link()),
+                ('results', data),
+            ]))
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if self.skip_count:
+            if not self.has_next:
+                return None
+            return replace_query_param(
+                self.request.build_absolute_uri(),
+                self.page_query_param,
+                self.page_number + 1,
+            )
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_position(self.page[-1]),
+        )
+
+    def get_previous_link(self):
+        if not self.skip_count:
+            return super().get_previous_link()
+        if self.page_number == 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(
+            url, self.page_query_param, self.page_number - 1)
+
+    def encode_position(self, obj):
+        values = [
+            self.get_field(type(obj), name).value_to_string(obj)
+            for name in self.field_names()
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def field_names(self):
+        return [name.lstrip('-') for name in self.ordering]
+
+    @staticmethod
+    def get_field(model, name):
+        return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+    def after_position(self, model, position):
+        """
+        Условие «строго после позиции» для сортировки self.ordering:
+        (a < x) OR (a = x AND b < y) OR ... с учетом направления полей.
+        Дополнительное a <= x дает базе диапазон для поиска по индексу.
+        """
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(position.encode()))
+            values = [
+                self.get_field(model, name).to_python(value)
+                for name, value in zip(self.field_names(), raw)
+            ]
+        except (ValueError, TypeError, ValidationError):
+            raise NotFound('Неверный курсор.')
+        if len(values) != len(self.ordering):
+            raise NotFound('Неверный курсор.')
+        condition = Q()
+        equal = Q()
+        for name, value in zip(self.ordering, values):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        first = self.ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': values[0]}) & condition
@@ -0,0 +1,151 @@
+import copy
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from foodgram.db_router import cache_timeout
+from recipes.memberships import flags_version, get_memberships
+from recipes.versions import get_versions
+from users.models import Subscribe
+
+# версии данных, из которых состоит ответ с рецептами: рецепты
+# с составом, тегами и авторами, справочники тегов и ингридиентов
+# (см. recipes.signals)
+CONTENT_VERSIONS = ('recipes', 'tags', 'ingredients')
+# с этими фильтрами выборка зависит от пользователя, такие
+# ответы не кешируются
+USER_FILTERS = ('is_favorited', 'is_in_shopping_cart')
+
+
+def get_recipes(data):
+    """Рецепты в теле ответа: страница списка или один рецепт."""
+    if 'results' in data:
+        return data['results']
+    return [data]
+
+
+def strip_flags(data):
+    """Копия ответа, какой ее видит анонимный пользователь."""
+    shared = copy.deepcopy(data)
+    for recipe in get_recipes(shared):
+        recipe['is_favorited'] = False
+        recipe['is_in_shopping_cart'] = False
+        recipe['author']['is_subscribed'] = False
+    return shared
+
+
+def collect_flags(data):
+    """Флаги пользователя из ответа, собранного для него."""
+    recipes = get_recipes(data)
+    return {
+        'favorited': [
+            recipe['id'] for recipe in recipes if recipe['is_favorited']],
+        'in_cart': [
+            recipe['id'] for recipe in recipes
+            if recipe['is_in_shopping_cart']
+        ],
+        'subscribed': list({
+            recipe['author']['id'] for recipe in recipes
+            if recipe['author']['is_subscribed']
+        }),
+    }
+
+
+def query_flags(user, data):
+    """
+    Флаги пользователя для рецептов ответа: избранное и корзина
+    из памяти процесса, подписки — запросом к базе.
+    """
+    recipes = get_recipes(data)
+    memberships = get_memberships(user)
+    authors = {recipe['author']['id'] for recipe in recipes}
+    return {
+        'favorited': [
+            recipe['id'] for recipe in recipes
+            if recipe['id'] in memberships.favorited
+        ],
+        'in_cart': [
+            recipe['id'] for recipe in recipes
+            if recipe['id'] in memberships.in_cart
+        ],
+        'subscribed': list(Subscribe.objects.filter(
+            follower=user, following_id__in=authors,
+        ).values_list('following_id', flat=True)) if authors else [],
+    }
+
+
+def apply_flags(data, flags):
+    favorited = set(flags['favorited'])
+    in_cart = set(flags['in_cart'])
+    subscribed = set(flags['subscribed'])
+    for recipe in get_recipes(data):
+        recipe['is_favorited'] = recipe['id'] in favorited
+        recipe['is_in_shopping_cart'] = recipe['id'] in in_cart
+        recipe['author']['is_subscribed'] = (
+            recipe['author']['id'] in subscribed)
+    return data
+
+
+class ResponseCacheMixin:
+    """
+    Кеш ответов list и retrieve вьюсета рецептов.
+
+    Тело ответа общее для всех пользователей и хранится в кеше Django
+    в том виде, в каком его видит анонимный пользователь. Для
+    авторизованного поверх него выставляются флаги is_favorited,
+    is_in_shopping_cart и is_subscribed, которые кешируются отдельно
+    для каждого пользователя. Ключи содержат версии данных, поэтому
+    запись в рецепты, теги, ингридиенты, избранное, корзину или
+    подписки делает старые записи недоступными (см. recipes.signals).
+    Работает с любым бэкендом кеша, в том числе локальным и файловым.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def get_cache_key(self, request, versions):
+        params = sorted(
+            (key, value) for key, values in request.query_params.lists()
+            for value in values
+        )
+        raw = f'{versions}:{request.get_host()}:{request.path}:{params}'
+        return 'recipes:response:' + hashlib.md5(raw.encode()).hexdigest()
+
+    def cached_response(self, render, request, *args, **kwargs):
+        if any(request.query_params.get(name) == '1'
+               for name in USER_FILTERS):
+            return render(request, *args, **kwargs)
+        user = request.user
+        # версии читаются до построения ответа: если данные изменятся
+        # во время запроса, ответ ляжет под уже устаревший ключ
+        names = [*CONTENT_VERSIONS]
+        if user.is_authenticated:
+            names.append(flags_version(user.pk))
+        versions = get_versions(names)
+        key = self.get_cache_key(request, versions[:len(CONTENT_VERSIONS)])
+        flags_key = f'{key}:{user.pk}:{versions[-1]}'
+        timeout = cache_timeout(
+            getattr(settings, 'RECIPE_RESPONSE_CACHE_TIMEOUT', 300))
+
+        data = cache.get(key)
+        if data is None:
+            response = render(request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, strip_flags(response.data), timeout)
+                if user.is_authenticated:
+                    cache.set(
+                        flags_key, collect_flags(response.data), timeout)
+            return response
+        if user.is_authenticated:
+            flags = cache.get(flags_key)
+            if flags is None:
+                flags = query_flags(user, data)
+                cache.set(flags_key, flags, timeout)
+            apply_flags(data, flags)
+        return Response(data)
@@ -1,20 +1,49 @@
 import base64
 import webcolors
 
+from functools import partial
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.db import transaction
 from rest_framework import serializers
 
+from recipes import cart
+from recipes.images import FORMATS, derivative_url, get_widths
+from recipes.memberships import get_memberships
 from recipes.models import (
+    ImageUpload,
     Ingredient,
     Tag,
     Recipe,
     IngredientRecipe,
-    UserFavoriteRecipes,
-    UserShoppingCartRecipes,
 )
 from users.models import User, Subscribe
 
+from . import uploads
+
+
+def request_memberships(request):
+    """
+    Избранное и корзина пользователя запроса (recipes.memberships),
+    один раз на запрос, сколько бы рецептов ни сериализовалось.
+    """
+    memberships = getattr(request, '_recipe_memberships', None)
+    if memberships is None:
+        memberships = get_memberships(request.user)
+        request._recipe_memberships = memberships
+    return memberships
+
+
+def get_recipes_limit(request):
+    """Значение ?recipes_limit=; без него или при ошибке — без лимита."""
+    try:
+        recipes_limit = int(request.query_params['recipes_limit'])
+    except (KeyError, ValueError):
+        return None
+    return recipes_limit if recipes_limit >= 0 else None
+
 
 class UsersSerializer(serializers.ModelSerializer):
     """
@@ -37,6 +66,8 @@ class UsersSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         """Метод добавляет поле is_subscribed в ответ."""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get("request")
         if request.user.is_authenticated:
             return Subscribe.objects.filter(
@@ -111,13 +142,100 @@ class TagSerializer(serializers.ModelSerializer):
 
 
 class Base64ImageField(serializers.ImageField):
+    """
+    Картинка в base64 (data:image/...;base64,...), файлом или токеном
+    завершенной загрузки из /api/uploads/.
+    Pillow в запросе не вызывается: файл сохраняется как есть,
+    а проверяет и перекодирует его фоновый обработчик
+    (см. recipes.images, команда run_worker).
+    """
+    default_error_messages = {
+        'invalid_upload': 'Загрузка не найдена или еще не завершена.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            try:
+                format, imgstr = data.split(';base64,')
+                ext = format.split('/')[-1]
+                content = base64.b64decode(imgstr)
+            except ValueError:
+                self.fail('invalid_image')
+            if ext not in uploads.EXTENSIONS:
+                self.fail('invalid_image')
+            data = ContentFile(content, name='temp.' + ext)
+        elif isinstance(data, str):
+            data = self.open_upload(data)
+
+        return serializers.FileField.to_internal_value(self, data)
+
+    def open_upload(self, token):
+        request = self.context.get('request')
+        try:
+            upload = ImageUpload.objects.get(token=token, user=request.user)
+        except (ImageUpload.DoesNotExist, ValidationError):
+            self.fail('invalid_upload')
+        if not upload.completed:
+            self.fail('invalid_upload')
+        return uploads.UploadedImage(upload)
+
+
+class ImageUploadSerializer(serializers.ModelSerializer):
+    completed = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = ImageUpload
+        fields = ('token', 'filename', 'size', 'total_size', 'completed')
+        read_only_fields = ('token', 'size')
 
-        return super().to_internal_value(data)
+    def validate_filename(self, value):
+        if uploads.get_extension(value) is None:
+            raise serializers.ValidationError(
+                f'Допустимые форматы: {", ".join(uploads.EXTENSIONS)}')
+        return value
+
+    def validate_total_size(self, value):
+        if not 0 < value <= settings.IMAGE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(
+                f'Размер файла должен быть от 1 до '
+                f'{settings.IMAGE_UPLOAD_MAX_SIZE} байт')
+        return value
+
+
+class RecipeImagesMixin(serializers.Serializer):
+    """
+    Поля image_thumb (превью для карточки) и srcset (уменьшенные
+    копии по типам: {'image/webp': 'url 320w, ...', ...}).
+    Пока картинка не обработана (image_status не ready), image_thumb —
+    исходный файл, а srcset — null.
+    """
+    image_thumb = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+
+    def build_url(self, url):
+        request = self.context.get('request')
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+    def get_image_thumb(self, obj):
+        if obj.image_status != Recipe.IMAGE_READY:
+            return self.build_url(obj.image.url)
+        return self.build_url(derivative_url(
+            obj.image.name, settings.RECIPE_THUMBNAIL_WIDTH, 'jpeg'))
+
+    def get_srcset(self, obj):
+        if obj.image_status != Recipe.IMAGE_READY:
+            return None
+        name = obj.image.name
+        return {
+            content_type: ', '.join(
+                f'{self.build_url(derivative_url(name, width, image_format))}'
+                f' {width}w'
+                for width in get_widths()
+            )
+            for image_format, (_, _, content_type) in FORMATS.items()
+        }
 
 
 class IngredientsEditSerializer(serializers.ModelSerializer):
@@ -167,65 +285,120 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
         return value
 
     def validate_ingredients(self, value):
-        ingredient_list = []
+        """Проверка всех ингридиентов одним запросом."""
         if not value:
             raise serializers.ValidationError(
                 'Ингридиенты обызательны для рецептов')
-        for items in value:
-            if not Ingredient.objects.filter(id=items['id']).exists():
-                raise serializers.ValidationError(
-                    'Такого ингридиента не существует')
-            ingredient = Ingredient.objects.get(id=items['id'])
-            if ingredient in ingredient_list:
-                raise serializers.ValidationError(
-                    'Ингридиент должен быть уникальным')
-            ingredient_list.append(ingredient)
-            if items['amount'] == 0:
-                raise serializers.ValidationError(
-                    'Количество укажите количество больше 0')
+        ids = [items['id'] for items in value]
+        unique_ids = set(ids)
+        if len(unique_ids) != len(Ingredient.objects.in_bulk(unique_ids)):
+            raise serializers.ValidationError(
+                'Такого ингридиента не существует')
+        if len(unique_ids) != len(ids):
+            raise serializers.ValidationError(
+                'Ингридиент должен быть уникальным')
+        if any(items['amount'] == 0 for items in value):
+            raise serializers.ValidationError(
+                'Количество укажите количество больше 0')
         return value
 
+    @staticmethod
+    def set_ingredients(recipe, amounts, current=()):
+        """
+        Приводит состав рецепта к amounts ({id ингридиента: количество}).
+        current — строки (pk, id ингридиента, количество), которые
+        уже есть: меняются только отличающиеся, не больше одного
+        DELETE, UPDATE и INSERT.
+        """
+        current = {
+            ingredient_id: (pk, amount)
+            for pk, ingredient_id, amount in current
+        }
+        to_delete = [
+            pk for ingredient_id, (pk, _) in current.items()
+            if ingredient_id not in amounts
+        ]
+        to_update = [
+            IngredientRecipe(pk=current[ingredient_id][0], amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id in current
+            and current[ingredient_id][1] != amount
+        ]
+        to_create = [
+            IngredientRecipe(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in current
+        ]
+        if to_delete:
+            IngredientRecipe.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            IngredientRecipe.objects.bulk_update(to_update, ['amount'])
+        if to_create:
+            IngredientRecipe.objects.bulk_create(to_create)
+
+    @transaction.atomic(savepoint=False)
     def creating(self, validated_data, recipe=None):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
+        amounts = {ingr['id']: ingr['amount'] for ingr in ingredients}
         if not recipe:
             recipe = Recipe.objects.create(**validated_data)
+            current = []
+        else:
+            current = list(
+                IngredientRecipe.objects.filter(recipe=recipe).values_list(
+                    'pk', 'ingredient_id', 'amount')
+            )
         recipe.tags.set(tags)
-        if IngredientRecipe.objects.filter(recipe=recipe).exists():
-            IngredientRecipe.objects.filter(recipe=recipe).delete()
-        IngredientRecipe.objects.bulk_create(
-            [
-                IngredientRecipe(
-                    recipe=recipe,
-                    ingredient=get_object_or_404(
-                        Ingredient,
-                        pk=ingr.get('id')),
-                    amount=ingr.get('amount')
-                )
-                for ingr in ingredients
-            ]
-        )
+        # списки покупок пересчитываются разом, а не сигналами
+        # по каждой удаляемой строке состава
+        with cart.handled(recipe.pk):
+            self.set_ingredients(recipe, amounts, current)
+            cart.recipe_changed(recipe.pk, {
+                ingredient_id: amount for _, ingredient_id, amount in current
+            }, amounts)
         return recipe, validated_data
 
     def create(self, validated_data):
         """Создание рецепта."""
+        image = validated_data.get('image')
         recipe, validated_data = self.creating(validated_data)
+        self.release_upload(image)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
         """Обновление рецепта."""
+        image = validated_data.get('image')
         recipe, validated_data = self.creating(validated_data, recipe)
-        return super().update(recipe, validated_data)
+        recipe = super().update(recipe, validated_data)
+        self.release_upload(image)
+        return recipe
+
+    @staticmethod
+    def release_upload(image):
+        """
+        Загрузка из /api/uploads/ удаляется после коммита,
+        когда файл уже скопирован в хранилище.
+        """
+        if getattr(image, 'upload', None) is not None:
+            transaction.on_commit(partial(uploads.release_upload, image))
 
     def to_representation(self, instance):
+        """
+        Ответ по свежей выборке for_read: состав, теги и автор
+        читаются постоянным числом запросов.
+        """
+        request = self.context.get('request')
         return RecipeSerializer(
-            instance,
+            Recipe.objects.for_read(request.user).get(pk=instance.pk),
             context={
-                'request': self.context.get('request')
+                'request': request
             }).data
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class RecipeSerializer(RecipeImagesMixin, serializers.ModelSerializer):
     """
     Сериализатор рецепта
     """
@@ -249,21 +422,24 @@ class RecipeSerializer(serializers.ModelSerializer):
             "name",
             "text",
             "cooking_time",
-            "image"
+            "image",
+            "image_status",
+            "image_thumb",
+            "srcset",
         )
 
     def get_is_favorited(self, obj):
+        """Проверка по избранному пользователя в памяти, без запроса."""
         request = self.context.get('request')
-        return UserFavoriteRecipes.objects.filter(
-            recipe=obj, user=request.user).exists()
+        return obj.pk in request_memberships(request).favorited
 
     def get_is_in_shopping_cart(self, obj):
         request = self.context.get('request')
-        return UserShoppingCartRecipes.objects.filter(
-            recipe=obj, user=request.user).exists()
+        return obj.pk in request_memberships(request).in_cart
 
 
-class CompactRecipeSerializer(serializers.ModelSerializer):
+class CompactRecipeSerializer(
+        RecipeImagesMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
@@ -271,6 +447,8 @@ class CompactRecipeSerializer(serializers.ModelSerializer):
             "id",
             "name",
             "image",
+            "image_thumb",
+            "srcset",
             "cooking_time",
         )
 
@@ -294,6 +472,8 @@ class SubscriptionsSerializers(UsersSerializer):
 
     def get_is_subscribed(self, obj):
         """Метод добавляет поле is_subscribed в ответ."""
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get("request")
         if request.user.is_authenticated:
             return Subscribe.objects.filter(
@@ -301,13 +481,20 @@ class SubscriptionsSerializers(UsersSerializer):
         return False
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj).count()
+        return obj.recipes_count
 
     def get_recipes(self, obj):
-        recipes = obj.recipes
-        request = self.context.get("request")
-        recipes_limit = int(request.query_params.get('recipes_limit'))
-        recipes = recipes.filter().order_by('-pub_date')[:recipes_limit]
+        """
+        Берет рецепты, подготовленные RecipeQuerySet.latest_by_author,
+        если они есть.
+        """
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            recipes = obj.recipes.order_by('-pub_date')
+            recipes_limit = get_recipes_limit(self.context.get("request"))
+            if recipes_limit is not None:
+                recipes = recipes[:recipes_limit]
         serializer = CompactRecipeSerializer(recipes, many=True)
         return serializer.data
 
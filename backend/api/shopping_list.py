@@ -0,0 +1,110 @@
+import csv
+import itertools
+import tempfile
+
+from django.conf import settings
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from recipes.models import ShoppingListItem
+
+DATE_FORMAT = '%d-%m-%Y %H:%M'
+PDF_FONT_NAME = 'ShoppingListFont'
+CHUNK_SIZE = 64 * 1024
+# PDF больше этого размера пишется во временный файл на диске
+PDF_SPOOL_SIZE = 1024 * 1024
+
+
+def get_shopping_list(user):
+    """
+    Список покупок пользователя из ShoppingListItem,
+    который поддерживается при изменении корзины (см. recipes.cart).
+    """
+    return (
+        ShoppingListItem.objects
+        .filter(user=user)
+        .order_by('ingredient__name')
+        .values_list(
+            'ingredient__name', 'ingredient__measurement_unit',
+            'total_amount')
+    )
+
+
+def header(user):
+    return (
+        f'Список покупок для:\n\n{user.first_name} {user.last_name}\n'
+        f'{timezone.now().strftime(DATE_FORMAT)}\n'
+    )
+
+
+def render_txt(user, rows):
+    yield header(user)
+    for name, unit, total in rows:
+        yield f'{name}: {total} {unit}\n'
+    yield '\nСоздано Foodgram'
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу отдает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(user, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингридиент', 'Количество', 'Единица измерения'))
+    for name, unit, total in rows:
+        yield writer.writerow((name, total, unit))
+
+
+def render_pdf(user, rows):
+    """
+    PDF по одной строке на ингридиент. Размер документа ограничен
+    размером справочника ингридиентов, а не числом рецептов в корзине.
+    Строки читаются из базы по мере вывода, готовый документ пишется
+    в SpooledTemporaryFile (на диск, если больше PDF_SPOOL_SIZE)
+    и отдается кусками по CHUNK_SIZE.
+    """
+    if PDF_FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(
+            TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT))
+    with tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_SIZE) as buffer:
+        draw_pdf(buffer, user, rows)
+        buffer.seek(0)
+        yield from iter(lambda: buffer.read(CHUNK_SIZE), b'')
+
+
+def draw_pdf(buffer, user, rows):
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 18
+
+    def new_page():
+        pdf.setFont(PDF_FONT_NAME, 12)
+        return height - margin
+
+    y = new_page()
+    lines = itertools.chain(
+        header(user).splitlines(),
+        (f'{name}: {total} {unit}' for name, unit, total in rows),
+        ('', 'Создано Foodgram'),
+    )
+    for line in lines:
+        if y < margin:
+            pdf.showPage()
+            y = new_page()
+        pdf.drawString(margin, y, line)
+        y -= line_height
+    pdf.save()
+
+
+# формат: (content type, расширение файла, функция рендера)
+FORMATS = {
+    'txt': ('text/plain; charset=utf-8', 'txt', render_txt),
+    'csv': ('text/csv; charset=utf-8', 'csv', render_csv),
+    'pdf': ('application/pdf', 'pdf', render_pdf),
+}
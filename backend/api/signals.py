@@ -0,0 +1,62 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from rest_framework.authtoken.models import Token
+
+from recipes.models import (
+    IngredientRecipe,
+    Recipe,
+    Tag,
+    UserFavoriteRecipes,
+    UserShoppingCartRecipes,
+)
+from recipes.versions import bump_table_version
+from users.models import Subscribe, User
+
+from .authentication import invalidate_tokens, invalidate_user_tokens
+
+# модели, по таблицам которых фильтруются постраничные списки
+PAGINATED_MODELS = (
+    IngredientRecipe,
+    Recipe,
+    Tag,
+    UserFavoriteRecipes,
+    UserShoppingCartRecipes,
+    Subscribe,
+    User,
+)
+
+
+def table_changed(sender, **kwargs):
+    """
+    Сбрасывает закешированные COUNT(*) по таблице модели после
+    фиксации транзакции: иначе параллельный запрос успел бы
+    посчитать старые данные и сохранить их под новой версией.
+    """
+    transaction.on_commit(lambda: bump_table_version(sender))
+
+
+def m2m_table_changed(sender, action, **kwargs):
+    if action.startswith('post_'):
+        transaction.on_commit(lambda: bump_table_version(sender))
+
+
+def token_deleted(sender, instance, **kwargs):
+    """Выход пользователя или удаление токена."""
+    key = instance.key
+    transaction.on_commit(lambda: invalidate_tokens([key]))
+
+
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    """Сбрасывает закешированного пользователя его токена."""
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidate_user_tokens([pk]))
+
+
+for model in PAGINATED_MODELS:
+    post_save.connect(table_changed, sender=model)
+    post_delete.connect(table_changed, sender=model)
+m2m_changed.connect(m2m_table_changed, sender=Recipe.tags.through)
+post_delete.connect(token_deleted, sender=Token)
+post_save.connect(user_saved, sender=User)
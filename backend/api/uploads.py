@@ -0,0 +1,102 @@
+import os
+import re
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.move import file_move_safe
+
+from .exceptions import InvalidContentRange
+
+CHUNK_SIZE = 64 * 1024
+EXTENSIONS = ('jpeg', 'jpg', 'png', 'gif', 'webp')
+CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+def get_extension(filename):
+    """Расширение файла, если это допустимая картинка, иначе None."""
+    extension = os.path.splitext(filename)[1].lstrip('.').lower()
+    return extension if extension in EXTENSIONS else None
+
+
+def upload_path(upload):
+    return os.path.join(settings.IMAGE_UPLOAD_DIR, f'{upload.token}.part')
+
+
+def parse_content_range(header):
+    """'bytes 0-65535/1000000' -> (начало, длина, размер файла)."""
+    match = CONTENT_RANGE.match(header or '')
+    if match is None:
+        raise InvalidContentRange
+    start, end, total = map(int, match.groups())
+    if end < start or end >= total:
+        raise InvalidContentRange
+    return start, end - start + 1, total
+
+
+def store_file(upload, uploaded_file):
+    """
+    Переносит файл, который Django при разборе multipart уже записал
+    во временный файл, в каталог загрузок без копирования в память.
+    """
+    os.makedirs(settings.IMAGE_UPLOAD_DIR, exist_ok=True)
+    file_move_safe(
+        uploaded_file.temporary_file_path(),
+        upload_path(upload),
+        allow_overwrite=True,
+    )
+
+
+def append_chunk(upload, stream, length):
+    """
+    Дописывает в файл загрузки length байт из stream кусками
+    по CHUNK_SIZE. Хвост от прерванной записи отрезается,
+    поэтому часть можно безопасно отправить повторно.
+    """
+    os.makedirs(settings.IMAGE_UPLOAD_DIR, exist_ok=True)
+    path = upload_path(upload)
+    with open(path, 'ab') as part:
+        part.truncate(upload.size)
+        remaining = length
+        while remaining:
+            chunk = stream.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                part.truncate(upload.size)
+                raise InvalidContentRange
+            part.write(chunk)
+            remaining -= len(chunk)
+
+
+class UploadedImage(File):
+    """
+    Файл завершенной загрузки для поля image рецепта. Файл на диске
+    открывается в with только на время чтения, так что рецепт,
+    не прошедший проверку, не оставляет открытого дескриптора.
+    Хранилище копирует его кусками, целиком в память он не читается.
+    """
+
+    def __init__(self, upload):
+        super().__init__(
+            None, name=f'upload.{get_extension(upload.filename)}')
+        self.upload = upload
+        self.size = upload.size
+
+    def read(self, size=-1):
+        with open(upload_path(self.upload), 'rb') as part:
+            return part.read(size)
+
+    def chunks(self, chunk_size=None):
+        with open(upload_path(self.upload), 'rb') as part:
+            yield from File(part).chunks(chunk_size)
+
+
+def delete_upload(upload):
+    try:
+        os.remove(upload_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+def release_upload(image):
+    """Удаляет загрузку, из которой сохранена картинка."""
+    delete_upload(image.upload)
@@ -6,6 +6,7 @@ from .views import (
     RecipeViewSet,
     IngredientViewSet,
     TagViewSet,
+    ImageUploadViewSet,
 )
 
 
@@ -16,6 +17,7 @@ router.register('users', UserViewSet, basename='users')
 router.register('recipes', RecipeViewSet, basename='recipes')
 router.register('ingredients', IngredientViewSet, basename='ingridients')
 router.register('tags', TagViewSet, basename='tags')
+router.register('uploads', ImageUploadViewSet, basename='uploads')
 
 urlpatterns = [
     path('', include(router.urls)),
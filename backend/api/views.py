@@ -1,24 +1,34 @@
-from django.db.models import Sum, Q
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import transaction
+from django.db.models import BooleanField, Exists, OuterRef, Value
 from django.db.utils import IntegrityError
-from django.http.response import HttpResponse
+from django.http.response import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework.decorators import action
-from rest_framework import viewsets, status
-from rest_framework.exceptions import AuthenticationFailed
+from rest_framework import mixins, viewsets, status
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, SAFE_METHODS
+from rest_framework.permissions import (
+    IsAdminUser,
+    IsAuthenticated,
+    SAFE_METHODS,
+)
 from urllib.parse import unquote
 
 
+from .catalogs import ingredients_catalog, tags_catalog
 from .exceptions import (
     UserNotFound,
     NotFollower,
     AlreadyFollower,
-    AlreadyInCart
+    AlreadyInCart,
+    InvalidContentRange,
+    UnknownFileFormat,
+    UploadOffsetMismatch,
+    UploadTooLarge,
 )
 from .serializers import (
     UsersSerializer,
@@ -28,17 +38,27 @@ from .serializers import (
     RecipeSerializer,
     RecipeWriteSerializer,
     CompactRecipeSerializer,
-    UserWithRecipesSerializer
+    ImageUploadSerializer,
+    UserWithRecipesSerializer,
+    get_recipes_limit,
 )
+from .filters import RecipeFilter
 from .paginators import PagePagination
 from .permissions import AdminOrReadOnly, RecipePermissions, UserPermission
+from .response_cache import ResponseCacheMixin
+from .shopping_list import FORMATS as SHOPPING_LIST_FORMATS, get_shopping_list
+from . import uploads
+from recipes import cart
+from recipes.ingredient_index import search_ingredients
 from recipes.models import (
+    ImageUpload,
     Tag,
     Ingredient,
     Recipe,
     UserFavoriteRecipes,
     UserShoppingCartRecipes,
 )
+from recipes.transfer import export_recipes, import_recipes, to_ndjson
 
 from users.models import Subscribe, User
 
@@ -73,6 +93,20 @@ class UserViewSet(DjoserUserViewSet):
     serializer_class = UsersSerializer
     permission_classes = (UserPermission,)
     pagination_class = PagePagination
+    cursor_ordering = ('id',)
+
+    def get_queryset(self):
+        """
+        Список пользователей с флагом is_subscribed в том же запросе,
+        а не запросом на каждого пользователя страницы
+        """
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.action == 'list' and user.is_authenticated:
+            queryset = queryset.annotate(is_subscribed=Exists(
+                Subscribe.objects.filter(
+                    follower=user, following=OuterRef('pk'))))
+        return queryset
 
     @action(
         detail=False,
@@ -83,17 +117,22 @@ class UserViewSet(DjoserUserViewSet):
         Функция для получения подписок
         авторизованного пользователя
         """
-        following = User.objects.filter(follower__follower=request.user)
+        following = User.objects.filter(
+            follower__follower=request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+        )
         page = self.paginate_queryset(following)
-        if page is not None:
-            serializer = SubscriptionsSerializers(
-                page,
-                many=True,
-                context={'request': request}
-            )
-            return self.get_paginated_response(serializer.data)
+        latest = Recipe.objects.latest_by_author(
+            [user.pk for user in page],
+            get_recipes_limit(request),
+        )
+        for user in page:
+            user.latest_recipes = latest.get(user.pk, [])
         serializer = SubscriptionsSerializers(
-            page, many=True, context={'request': request}
+            page,
+            many=True,
+            context={'request': request}
         )
         return self.get_paginated_response(serializer.data)
 
@@ -133,7 +172,7 @@ class UserViewSet(DjoserUserViewSet):
                     following=following,
                 )
                 obj.delete()
-                return Response(status.HTTP_204_NO_CONTENT)
+                return Response(status=status.HTTP_204_NO_CONTENT)
             except Subscribe.DoesNotExist:
                 raise NotFollower
         # подписка
@@ -197,50 +236,40 @@ class UserViewSet(DjoserUserViewSet):
         return Response(serializer.data, status.HTTP_200_OK)
 
 
-DATE_FORMAT = '%d-%m-%Y %H:%M'
+INGREDIENT_SEARCH_MAX_LIMIT = 100
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ResponseCacheMixin, viewsets.ModelViewSet):
     """
     Вьюсет рецепта
     """
     serializer_class = RecipeSerializer
     filter_backends = (DjangoFilterBackend,)
-    filterset_fields = ('tags__slug', 'author')
+    filterset_class = RecipeFilter
     permission_classes = (RecipePermissions,)
     pagination_class = PagePagination
+    recipe_ordering = ('-pub_date', '-id')
+
+    @property
+    def cursor_ordering(self):
+        """
+        Поля keyset-пагинации. Результаты поиска упорядочены
+        по релевантности, поэтому для них остается постраничная.
+        """
+        if self.request.query_params.get('search', '').strip():
+            return None
+        return self.recipe_ordering
 
     def get_queryset(self):
         """
         Выбор списка рецептов в зависимости от страницы
         """
-        # корзнина покупок
-        if self.request.query_params.get('is_in_shopping_cart') == '1':
-            if self.request.user.is_authenticated:
-                queryset = Recipe.objects.filter(
-                    users_shopping__user=self.request.user
-                )
-                return queryset
-            raise AuthenticationFailed(
-                detail="Доступно только авторизованным пользователем")
-        # избранное
-        elif self.request.query_params.get('is_favorited') == '1':
-            if self.request.user.is_authenticated:
-                queryset = Recipe.objects.filter(
-                    users_favorite__user=self.request.user
-                )
-                return queryset
-            raise AuthenticationFailed(
-                detail="Доступно только авторизованным пользователем")
-        else:
-            # фильтр по связанным тегам
-            tags = self.request.query_params.getlist('tags')
-            if tags:
-                queryset = Recipe.objects.filter(
-                    tags__slug__in=tags).distinct()
-                return queryset
-            # все рецепты
+        user = self.request.user
+        if self.action in ('update', 'partial_update', 'destroy'):
+            # ответ на запись строится заново (см. RecipeWriteSerializer)
             return Recipe.objects.all()
+        # фильтры списка применяет RecipeFilter
+        return Recipe.objects.for_read(user)
 
     def get_serializer_class(self):
         """
@@ -261,7 +290,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
         Удаление рецепта
         """
         instance = self.get_object()
-        instance.delete()
+        # списки покупок пересчитываются разом, а не сигналами
+        # по каждой удаляемой строке состава и корзины
+        with transaction.atomic(), cart.handled(instance.pk):
+            cart.recipe_deleted(instance.pk)
+            instance.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -276,12 +309,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
         recipe = get_object_or_404(Recipe, pk=pk)
         # удалить из корзины
         if request.method == "DELETE":
-            get_object_or_404(
-                UserShoppingCartRecipes,
-                user=request.user,
-                recipe=recipe
-            ).delete()
-            return Response(status.HTTP_204_NO_CONTENT)
+            with transaction.atomic():
+                get_object_or_404(
+                    UserShoppingCartRecipes,
+                    user=request.user,
+                    recipe=recipe
+                ).delete()
+            return Response(status=status.HTTP_204_NO_CONTENT)
         # добавить в корзину
         elif request.method == "POST":
             if UserShoppingCartRecipes.objects.filter(
@@ -289,12 +323,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
                     recipe=Recipe.objects.get(pk=pk)
             ).exists():
                 raise AlreadyInCart
-            UserShoppingCartRecipes.objects.create(
-                user=request.user,
-                recipe=Recipe.objects.get(pk=pk)
-            )
+            with transaction.atomic():
+                UserShoppingCartRecipes.objects.create(
+                    user=request.user,
+                    recipe=Recipe.objects.get(pk=pk)
+                )
             serializer = RecipeSerializer(
-                recipe,
+                Recipe.objects.for_read(request.user).get(pk=pk),
                 context={'request': request}
             )
             return Response(serializer.data, status.HTTP_201_CREATED)
@@ -319,7 +354,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 ).delete()
             except UserFavoriteRecipes.DoesNotExist:
                 return Response({"errors": "Не в избранном."})
-            return Response(status.HTTP_204_NO_CONTENT)
+            return Response(status=status.HTTP_204_NO_CONTENT)
         # добавление в избранное
         elif request.method == "POST":
             if UserFavoriteRecipes.objects.filter(
@@ -343,52 +378,78 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def download_shopping_cart(self, request):
         """
-        Скачивание корзины
+        Скачивание корзины в формате ?file_format=txt|csv|pdf
         """
-        recipes = Recipe.objects.filter(users_shopping__user=request.user)
-        ingredients = Ingredient.objects.filter(
-            recipe__in=recipes).annotate(
-                sum_amount=Sum('ingredientrecipe__amount')
-        )
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_LIST_FORMATS:
+            raise UnknownFileFormat
+        content_type, extension, render = SHOPPING_LIST_FORMATS[file_format]
         user = request.user
-        filename = f'{user.username}_buy_list.txt'
-        shopping_list = (
-            f'Список покупок для:\n\n{user.first_name} {user.last_name}\n'
-            f'{timezone.now().strftime(DATE_FORMAT)}\n'
+        rows = get_shopping_list(user).iterator()
+        response = StreamingHttpResponse(
+            render(user, rows), content_type=content_type
         )
-        for ing in ingredients:
-            shopping_list += (
-                f'{ing.name}: {ing.sum_amount} {ing.measurement_unit}\n'
-            )
-
-        shopping_list += '\nСоздано Foodgram'
+        response['Content-Disposition'] = (
+            f'attachment; filename={user.username}_buy_list.{extension}'
+        )
+        return response
 
-        response = HttpResponse(
-            shopping_list, content_type='text.txt; charset=utf-8'
+    @action(
+        detail=False,
+        url_path='export',
+        permission_classes=[IsAdminUser]
+    )
+    def export_recipes(self, request):
+        """
+        Выгрузка всех рецептов в NDJSON: по записи на строку,
+        ответ формируется по мере чтения из базы
+        """
+        response = StreamingHttpResponse(
+            to_ndjson(export_recipes()), content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = (
+            'attachment; filename=recipes.ndjson'
         )
-        response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
 
+    @action(
+        detail=False,
+        methods=['post'],
+        url_path='import',
+        permission_classes=[IsAdminUser]
+    )
+    def import_recipes(self, request):
+        """
+        Загрузка рецептов из NDJSON в теле запроса. Тело читается
+        построчно, без разбора парсерами DRF; авторы, которых нет
+        в базе, заменяются на текущего пользователя
+        """
+        result = import_recipes(request._request, default_author=request.user)
+        return Response(result)
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AdminOrReadOnly,)
 
-    def get_queryset(self):
+    def list(self, request):
         """
-        Поиск по ингридиентам для воода в форму создания
-        """
-        name = self.request.query_params.get('name')
-        queryset = self.queryset
-        if name:
-            if name[0] == '%':
-                name = unquote(name)
-            name = name.lower()
-            stw_queryset = queryset.filter(
-                Q(name__startswith=name) & Q(name__contains=name))
-            return stw_queryset
-        return queryset
+        Поиск по ингридиентам для ввода в форму создания.
+        Отвечает из индекса в памяти без запроса к базе.
+        """
+        name = request.query_params.get('name')
+        if not name:
+            return ingredients_catalog.response(request)
+        if name[0] == '%':
+            name = unquote(name)
+        limit = request.query_params.get('limit')
+        if limit is not None:
+            try:
+                limit = min(int(limit), INGREDIENT_SEARCH_MAX_LIMIT)
+            except ValueError:
+                limit = None
+        return Response(search_ingredients(name, limit))
 
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
@@ -397,3 +458,84 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     """
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+
+    def list(self, request):
+        return tags_catalog.response(request)
+
+
+# запас на заголовки multipart сверх IMAGE_UPLOAD_MAX_SIZE
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class ImageUploadViewSet(mixins.RetrieveModelMixin,
+                         mixins.DestroyModelMixin,
+                         viewsets.GenericViewSet):
+    """
+    Загрузка картинок рецептов без base64.
+
+    POST multipart с полем file загружает файл целиком, POST JSON
+    {"filename", "total_size"} начинает загрузку частями, которые
+    передаются PUT /uploads/{token}/ с заголовком Content-Range.
+    GET показывает, сколько байт уже получено, чтобы продолжить
+    прерванную загрузку. Файл пишется на диск потоком, в памяти
+    держится не больше одного куска.
+    """
+    serializer_class = ImageUploadSerializer
+    permission_classes = (IsAuthenticated,)
+    lookup_field = 'token'
+
+    def get_queryset(self):
+        queryset = ImageUpload.objects.filter(user=self.request.user)
+        if self.action == 'update':
+            # части одной загрузки дописываются по очереди (см. update)
+            queryset = queryset.select_for_update()
+        return queryset
+
+    def create(self, request):
+        max_length = settings.IMAGE_UPLOAD_MAX_SIZE + MULTIPART_OVERHEAD
+        if int(request.META.get('CONTENT_LENGTH') or 0) > max_length:
+            raise UploadTooLarge
+        # multipart сразу пишется во временный файл, а не в память
+        request._request.upload_handlers = [
+            TemporaryFileUploadHandler(request._request)]
+        file = request.FILES.get('file')
+        if file is None:
+            serializer = self.get_serializer(data=request.data)
+            serializer.is_valid(raise_exception=True)
+            serializer.save(user=request.user)
+        else:
+            serializer = self.get_serializer(data={
+                'filename': file.name,
+                'total_size': file.size,
+            })
+            serializer.is_valid(raise_exception=True)
+            upload = serializer.save(user=request.user, size=file.size)
+            uploads.store_file(upload, file)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def update(self, request, token):
+        """
+        Часть файла: тело запроса — байты start..end из заголовка
+        Content-Range: bytes start-end/total_size.
+        """
+        start, length, total = uploads.parse_content_range(
+            request.META.get('HTTP_CONTENT_RANGE'))
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if length != content_length:
+            raise InvalidContentRange
+        # строка загрузки заблокирована до конца записи части:
+        # параллельный PUT той же загрузки ждет и увидит новый size
+        with transaction.atomic():
+            upload = self.get_object()
+            if total != upload.total_size:
+                raise InvalidContentRange
+            if start != upload.size:
+                raise UploadOffsetMismatch(
+                    f'Получено {upload.size} байт, продолжите с этого места.')
+            uploads.append_chunk(upload, request._request, length)
+            upload.size = start + length
+            upload.save(update_fields=['size'])
+        return Response(self.get_serializer(upload).data)
+
+    def perform_destroy(self, instance):
+        uploads.delete_upload(instance)
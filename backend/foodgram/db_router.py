@@ -0,0 +1,92 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# реплика, с которой читает текущий запрос; None — основная база
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def client_key(request):
+    """Ключ клиента: токен из Authorization или сессия."""
+    credentials = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    digest = hashlib.sha256(credentials.encode()).hexdigest()
+    return f'db:primary:{digest}'
+
+
+def cache_timeout(timeout):
+    """
+    Срок хранения в кеше данных, прочитанных текущим запросом.
+    Реплика могла еще не получить запись, которая сменила версию
+    в ключе кеша, поэтому прочитанное с нее хранится не дольше
+    REPLICA_PIN_SECONDS.
+    """
+    if _read_alias.get() is None:
+        return timeout
+    return min(timeout, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+
+
+class ReplicaMiddleware:
+    """
+    Направляет чтения безопасных запросов (GET, HEAD, OPTIONS)
+    на одну из реплик DATABASE_REPLICAS.
+
+    После успешного изменяющего запроса клиент на
+    REPLICA_PIN_SECONDS секунд остается на основной базе, чтобы
+    видеть свои записи, пока они не дошли до реплик. Клиент
+    определяется по заголовку Authorization или cookie сессии,
+    так что авторизация для этого не нужна. Вне запросов (команды,
+    run_worker) все читается с основной базы.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        replicas = getattr(settings, 'DATABASE_REPLICAS', ())
+        key = client_key(request)
+        alias = None
+        if (replicas and request.method in SAFE_METHODS
+                and not (key and cache.get(key))):
+            alias = random.choice(replicas)
+        token = _read_alias.set(alias)
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        if (replicas and key and request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            cache.set(
+                key, True, getattr(settings, 'REPLICA_PIN_SECONDS', 10))
+        return response
+
+
+class ReplicaRouter:
+    """
+    Чтения — с реплики, выбранной ReplicaMiddleware, записи и
+    миграции — только на основную базу; реплики получают схему
+    и данные репликацией.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in getattr(settings, 'DATABASE_REPLICAS', ()):
+            return False
+        return None
@@ -0,0 +1,95 @@
+"""
+Бэкенд PostgreSQL с пулом соединений процесса.
+
+Подключается ENGINE='foodgram.postgresql_pool' и ключом POOL
+в настройках базы (SIZE, MAX_LIFETIME, TIMEOUT, CHECK_AFTER, см.
+foodgram.settings). Закрытие соединения Django в конце запроса
+возвращает его в пул, и следующий запрос любого потока процесса
+получает готовое соединение без установки нового.
+"""
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+from .pool import ConnectionPool
+
+_lock = threading.Lock()
+_pools = {}
+
+
+def check_connection(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except base.Database.Error:
+        return False
+
+
+def get_pool(conn_params, options):
+    """Пул на каждый набор параметров подключения."""
+    key = tuple(sorted((name, str(value))
+                       for name, value in conn_params.items()))
+    with _lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(
+                size=options.get('SIZE', 10),
+                max_lifetime=options.get('MAX_LIFETIME', 1800),
+                timeout=options.get('TIMEOUT', 10),
+                check_after=options.get('CHECK_AFTER', 30),
+                check=check_connection,
+            )
+        return _pools[key]
+
+
+def pool_stats():
+    """Счетчики всех пулов процесса: {база: stats()}."""
+    with _lock:
+        pools = dict(_pools)
+    return {dict(key).get('database'): pool.stats()
+            for key, pool in pools.items()}
+
+
+def reset_connection(connection):
+    """
+    Откатывает незавершенную транзакцию; False, если
+    соединение сломано и его нельзя вернуть в пул.
+    """
+    if connection.closed:
+        return False
+    status = connection.get_transaction_status()
+    if status == extensions.TRANSACTION_STATUS_IDLE:
+        return True
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        connection.rollback()
+    except base.Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        self.pool = get_pool(conn_params, self.settings_dict.get('POOL', {}))
+        connection = self.pool.acquire(
+            lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params))
+        self.isolation_level = connection.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        if self.pool is None:
+            return super()._close()
+        # внутри atomic() Django оставляет ссылку на закрытое
+        # соединение, отдавать его другому потоку нельзя
+        reusable = (
+            not self.in_atomic_block
+            and reset_connection(self.connection)
+        )
+        self.pool.release(self.connection, reusable)
@@ -0,0 +1,150 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Пул соединений процесса.
+
+    Держит не больше size открытых соединений; если все заняты,
+    ждет освобождения до timeout секунд. Соединение старше
+    max_lifetime секунд закрывается вместо возврата в пул, а
+    пролежавшее без дела дольше check_after секунд перед выдачей
+    проверяется функцией check. Счетчики выдач и ожиданий
+    возвращает stats().
+    """
+
+    def __init__(self, size, max_lifetime, timeout, check_after, check):
+        self.size = size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.check_after = check_after
+        self.check = check
+        self._cond = threading.Condition()
+        # свободные соединения: (соединение, время возврата)
+        self._idle = deque()
+        # время открытия каждого соединения пула
+        self._opened_at = {}
+        # соединения, которые сейчас открываются
+        self._opening = 0
+        self._stats = dict.fromkeys((
+            'checkouts', 'opened', 'closed', 'expired', 'failed_checks',
+            'waits', 'timeouts',
+        ), 0)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquire(self, connect):
+        """Свободное соединение пула или новое от connect()."""
+        start = time.monotonic()
+        while True:
+            with self._cond:
+                item = self._take(start)
+            connection = (
+                self._open(connect) if item is None
+                else self._check_idle(*item))
+            if connection is not None:
+                with self._cond:
+                    self._stats['checkouts'] += 1
+                return connection
+
+    def release(self, connection, reusable=True):
+        """Возвращает соединение в пул или закрывает его."""
+        if reusable and not self._expired(connection):
+            with self._cond:
+                self._idle.append((connection, time.monotonic()))
+                self._cond.notify()
+            return
+        self._discard(connection)
+
+    def stats(self):
+        with self._cond:
+            return {
+                **self._stats,
+                'open': len(self._opened_at),
+                'idle': len(self._idle),
+                'wait_ms_total': round(self._wait_total * 1000, 3),
+                'wait_ms_max': round(self._wait_max * 1000, 3),
+            }
+
+    def _take(self, start):
+        """
+        Свободное соединение, или None, если можно открыть новое:
+        место под него уже занято. Вызывается под блокировкой.
+        """
+        waited = False
+        while (not self._idle
+               and len(self._opened_at) + self._opening >= self.size):
+            remaining = self.timeout - (time.monotonic() - start)
+            if remaining <= 0:
+                self._stats['timeouts'] += 1
+                raise PoolTimeout(
+                    f'Нет свободных соединений за {self.timeout} с '
+                    f'(размер пула {self.size})')
+            waited = True
+            self._cond.wait(remaining)
+        if waited:
+            self._record_wait(time.monotonic() - start)
+        if self._idle:
+            return self._idle.pop()
+        self._opening += 1
+        return None
+
+    def _record_wait(self, seconds):
+        self._stats['waits'] += 1
+        self._wait_total += seconds
+        self._wait_max = max(self._wait_max, seconds)
+        logger.info('Ожидание соединения пула: %.1f мс', seconds * 1000)
+
+    def _open(self, connect):
+        try:
+            connection = connect()
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._opening -= 1
+            self._opened_at[connection] = time.monotonic()
+            self._stats['opened'] += 1
+        return connection
+
+    def _expired(self, connection):
+        opened_at = self._opened_at.get(connection)
+        return (
+            connection.closed or opened_at is None
+            or time.monotonic() - opened_at > self.max_lifetime
+        )
+
+    def _check_idle(self, connection, released):
+        """Соединение из пула, если оно еще годно, иначе None."""
+        if self._expired(connection):
+            failure = 'expired'
+        elif (time.monotonic() - released < self.check_after
+              or self.check(connection)):
+            return connection
+        else:
+            failure = 'failed_checks'
+        with self._cond:
+            self._stats[failure] += 1
+        self._discard(connection)
+        return None
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self._cond:
+            if self._opened_at.pop(connection, None) is not None:
+                self._stats['closed'] += 1
+            self._cond.notify()
@@ -57,6 +57,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'foodgram.db_router.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -96,7 +97,63 @@ DATABASES = {
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        # сколько секунд поток держит соединение; 0 — закрывать
+        # в конце каждого запроса
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=0)),
+    }
+}
+# Пул соединений процесса для PostgreSQL (foodgram.postgresql_pool):
+# DB_POOL_SIZE — сколько соединений держит процесс, 0 — без пула
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', default=0))
+if DB_POOL_SIZE and 'postgresql' in (DATABASES['default']['ENGINE'] or ''):
+    DATABASES['default']['ENGINE'] = 'foodgram.postgresql_pool'
+    DATABASES['default']['POOL'] = {
+        'SIZE': DB_POOL_SIZE,
+        # соединение старше этого закрывается при возврате в пул
+        'MAX_LIFETIME': int(
+            os.getenv('DB_POOL_MAX_LIFETIME', default=1800)),
+        # сколько секунд ждать свободного соединения
+        'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
+        # соединение, простоявшее дольше, проверяется SELECT 1
+        'CHECK_AFTER': float(os.getenv('DB_POOL_CHECK_AFTER', default=30)),
+    }
+
+# Реплики только для чтения (см. foodgram.db_router): копии default
+# с другими хостами DB_REPLICA_HOSTS=replica1,replica2 или, для
+# локальной проверки на SQLite, с другими файлами
+# DB_REPLICA_NAMES=/tmp/replica.sqlite3 (репликацию имитирует
+# команда sync_replicas)
+DATABASE_REPLICAS = []
+for field, values in (
+        ('HOST', os.getenv('DB_REPLICA_HOSTS', default='')),
+        ('NAME', os.getenv('DB_REPLICA_NAMES', default=''))):
+    for value in filter(None, values.split(',')):
+        alias = f'replica_{len(DATABASE_REPLICAS) + 1}'
+        DATABASES[alias] = {
+            **DATABASES['default'],
+            field: value,
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+# Сколько секунд после записи клиент читает с основной базы
+REPLICA_PIN_SECONDS = 10
+
+
+# Версии в кеше сбрасывают кеши всех процессов (recipes.versions),
+# поэтому кеш должен быть общим для gunicorn и worker:
+# CACHE_BACKEND=django_redis.cache.RedisCache
+# CACHE_LOCATION=redis://redis:6379/1
+# Кеш процесса по умолчанию подходит только для одного локального
+# процесса (предупреждение recipes.W001).
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache',
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default=''),
     }
 }
 
@@ -145,7 +202,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PAGINATION_CLASS':
         'rest_framework.pagination.LimitOffsetPagination',
@@ -172,3 +229,47 @@ AUTH_USER_MODEL = 'users.Custom_User'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Максимум подсказок в поиске ингридиентов по ?name=
+INGREDIENT_SEARCH_LIMIT = 20
+
+# max-age для справочников ингридиентов и тегов; при 0 клиент
+# каждый раз перепроверяет их по ETag и получает 304
+CATALOG_CACHE_MAX_AGE = 0
+
+# Сколько секунд кешировать COUNT(*) для постраничных списков
+PAGINATION_COUNT_CACHE_TIMEOUT = 30
+# На PostgreSQL выше этого числа строк в ответе отдается оценка
+# планировщика вместо точного COUNT(*); None — всегда точно
+PAGINATION_ESTIMATE_THRESHOLD = 10000
+
+# Сколько секунд хранить закешированные ответы списка и страницы
+# рецепта; запись в данные сбрасывает их раньше
+RECIPE_RESPONSE_CACHE_TIMEOUT = 300
+# Для скольких пользователей держать в памяти процесса id рецептов
+# из избранного и корзины (флаги is_favorited и is_in_shopping_cart)
+RECIPE_MEMBERSHIP_CACHE_SIZE = 1000
+# Кеш токенов (api.authentication): общий кеш и память процесса
+TOKEN_CACHE_TIMEOUT = 60
+TOKEN_LOCAL_CACHE_TIMEOUT = 5
+TOKEN_LOCAL_CACHE_SIZE = 1000
+
+# TTF-шрифт с кириллицей для списка покупок в PDF
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+)
+
+# Ширины уменьшенных копий картинок рецептов (WebP и JPEG)
+RECIPE_IMAGE_WIDTHS = (320, 640, 1280)
+# Ширина превью для карточек рецептов, одна из RECIPE_IMAGE_WIDTHS
+RECIPE_THUMBNAIL_WIDTH = 640
+RECIPE_IMAGE_QUALITY = 80
+
+# Каталог для частично загруженных через /api/uploads/ картинок
+IMAGE_UPLOAD_DIR = os.getenv(
+    'IMAGE_UPLOAD_DIR', default=os.path.join(BASE_DIR, 'uploads'))
+# Максимальный размер загружаемой картинки в байтах
+IMAGE_UPLOAD_MAX_SIZE = 20 * 1024 * 1024
+# Через сколько часов clear_uploads удаляет неиспользованные загрузки
+IMAGE_UPLOAD_EXPIRE_HOURS = 24
@@ -2,9 +2,11 @@ from django.contrib import admin
 
 from .models import (
     Tag,
+    ImageTask,
     Ingredient,
     Recipe,
     IngredientRecipe,
+    ShoppingListItem,
     UserFavoriteRecipes,
     UserShoppingCartRecipes
 )
@@ -40,6 +42,8 @@ class RecipeAdmin(admin.ModelAdmin):
     list_display = (
         'name',
         'author',
+        'favorites_count',
+        'image_status',
     )
     fields = (
         "author",
@@ -57,9 +61,16 @@ class RecipeAdmin(admin.ModelAdmin):
     """
 
 
+class ImageTaskAdmin(admin.ModelAdmin):
+    list_display = ('image', 'created', 'attempts', 'locked_until', 'error')
+    search_fields = ('image',)
+
+
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(IngredientRecipe)
 admin.site.register(UserFavoriteRecipes)
 admin.site.register(UserShoppingCartRecipes)
+admin.site.register(ShoppingListItem)
+admin.site.register(ImageTask, ImageTaskAdmin)
@@ -0,0 +1,162 @@
+import itertools
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections, router, transaction
+from django.db.models import Sum
+
+from .models import IngredientRecipe, ShoppingListItem, UserShoppingCartRecipes
+
+
+def recipe_amounts(recipe_id):
+    """Состав рецепта: {id ингридиента: количество}."""
+    return dict(
+        IngredientRecipe.objects.filter(recipe_id=recipe_id).values_list(
+            'ingredient_id', 'amount')
+    )
+
+
+def cart_user_ids(recipe_id):
+    return list(
+        UserShoppingCartRecipes.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True)
+    )
+
+
+# строк в одном INSERT ... ON CONFLICT
+UPSERT_BATCH = 300
+
+# рецепты, состав и корзины которых код меняет сам, пересчитывая
+# списки покупок разом; сигналы по их строкам ничего не делают
+_handled = ContextVar('cart_handled_recipes', default=frozenset())
+
+
+@contextmanager
+def handled(recipe_id):
+    token = _handled.set(_handled.get() | {recipe_id})
+    try:
+        yield
+    finally:
+        _handled.reset(token)
+
+
+def is_handled(recipe_id):
+    return recipe_id in _handled.get()
+
+
+def add_amounts(user_ids, deltas):
+    """
+    Прибавляет положительные deltas одним INSERT ... ON CONFLICT
+    DO UPDATE на пачку: параллельные запросы, добавляющие одну и ту же
+    новую позицию, не упираются в уникальность (user, ingredient).
+    """
+    connection = connections[router.db_for_write(ShoppingListItem)]
+    quote = connection.ops.quote_name
+    table = quote(ShoppingListItem._meta.db_table)
+    rows = [
+        (user_id, ingredient_id, delta)
+        for user_id in user_ids
+        for ingredient_id, delta in deltas.items()
+    ]
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_BATCH):
+            batch = rows[start:start + UPSERT_BATCH]
+            cursor.execute(
+                f'INSERT INTO {table} ({quote("user_id")}, '
+                f'{quote("ingredient_id")}, {quote("total_amount")}) '
+                f'VALUES {", ".join(["(%s, %s, %s)"] * len(batch))} '
+                f'ON CONFLICT ({quote("user_id")}, {quote("ingredient_id")}) '
+                f'DO UPDATE SET {quote("total_amount")} = '
+                f'{table}.{quote("total_amount")} '
+                f'+ EXCLUDED.{quote("total_amount")}',
+                list(itertools.chain.from_iterable(batch)),
+            )
+
+
+def subtract_amounts(user_ids, deltas):
+    """
+    Вычитает deltas (положительные) из существующих позиций:
+    SELECT ... FOR UPDATE, один UPDATE и DELETE обнулившихся.
+    """
+    items = ShoppingListItem.objects.select_for_update().filter(
+        user_id__in=user_ids, ingredient_id__in=deltas)
+    to_update = []
+    to_delete = []
+    for item in items:
+        item.total_amount -= deltas[item.ingredient_id]
+        if item.total_amount > 0:
+            to_update.append(item)
+        else:
+            to_delete.append(item.pk)
+    if to_update:
+        ShoppingListItem.objects.bulk_update(to_update, ['total_amount'])
+    if to_delete:
+        ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+
+
+@transaction.atomic(savepoint=False)
+def apply_deltas(user_ids, deltas):
+    """
+    Меняет списки покупок пользователей user_ids на deltas
+    ({id ингридиента: изменение количества}): число запросов
+    не зависит от числа позиций.
+    """
+    if not user_ids:
+        return
+    added = {pk: delta for pk, delta in deltas.items() if delta > 0}
+    removed = {pk: -delta for pk, delta in deltas.items() if delta < 0}
+    if added:
+        add_amounts(user_ids, added)
+    if removed:
+        subtract_amounts(user_ids, removed)
+
+
+def add_recipe(user_id, recipe_id):
+    apply_deltas([user_id], recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    apply_deltas([user_id], {
+        pk: -amount for pk, amount in recipe_amounts(recipe_id).items()})
+
+
+def recipe_changed(recipe_id, old_amounts, new_amounts):
+    """Переносит изменение состава рецепта в списки покупок
+    всех, у кого он в корзине."""
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    if any(deltas.values()):
+        apply_deltas(cart_user_ids(recipe_id), deltas)
+
+
+def recipe_deleted(recipe_id):
+    recipe_changed(recipe_id, recipe_amounts(recipe_id), {})
+
+
+@transaction.atomic(savepoint=False)
+def rebuild_shopping_lists():
+    """Пересобирает все списки покупок из корзин."""
+    ShoppingListItem.objects.all().delete()
+    totals = (
+        IngredientRecipe.objects
+        .filter(recipe__users_shopping__isnull=False)
+        .values('recipe__users_shopping__user', 'ingredient')
+        .annotate(total=Sum('amount'))
+        .order_by()
+        .values_list('recipe__users_shopping__user', 'ingredient', 'total')
+        .iterator()
+    )
+    created = 0
+    while True:
+        batch = [
+            ShoppingListItem(
+                user_id=user_id, ingredient_id=ingredient_id,
+                total_amount=total)
+            for user_id, ingredient_id, total in itertools.islice(
+                totals, 5000)
+        ]
+        if not batch:
+            return created
+        ShoppingListItem.objects.bulk_create(batch)
+        created += len(batch)
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+# кеши, которые не видят другие процессы
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+
+@register(Tags.caches)
+def shared_cache_check(app_configs, **kwargs):
+    """
+    Версии (recipes.versions) сбрасывают кеши ответов, справочников
+    и счетчиков всех процессов, только если лежат в общем кеше:
+    с кешем процесса gunicorn и worker не видят изменений друг друга.
+    Для одного локального процесса кеш процесса подходит.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        f'Кеш {backend} не общий для процессов',
+        hint='Для нескольких процессов задайте общий кеш: '
+             'CACHE_BACKEND=django_redis.cache.RedisCache и '
+             'CACHE_LOCATION=redis://redis:6379/1 или файловый',
+        id='recipes.W001',
+    )]
@@ -0,0 +1,55 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Subscribe, User
+
+from .models import Recipe, UserFavoriteRecipes, UserShoppingCartRecipes
+
+
+def change_counter(model, pk, field, delta):
+    """
+    Атомарно меняет счетчик field у строки pk на delta.
+    Счетчик не опускается ниже нуля, даже если рассинхронизирован.
+    """
+    if pk is None:
+        return
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def count_subquery(model, field):
+    """Число строк model, ссылающихся полем field на внешнюю строку."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+# модель со счетчиком, поле счетчика, (связанная модель, внешний ключ)
+COUNTERS = (
+    (Recipe, 'favorites_count', UserFavoriteRecipes, 'recipe'),
+    (Recipe, 'cart_count', UserShoppingCartRecipes, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscribe, 'following'),
+)
+
+
+def reconcile_counters():
+    """
+    Пересчитывает все счетчики одним UPDATE на каждый.
+    Возвращает [(модель, поле, число обновленных строк)].
+    """
+    return [
+        (model, field, model.objects.update(
+            **{field: count_subquery(related, foreign_key)}))
+        for model, field, related, foreign_key in COUNTERS
+    ]
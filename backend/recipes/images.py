@@ -0,0 +1,242 @@
+import io
+import logging
+import os
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import ImageTask, Recipe
+from .versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+THUMBNAILS_DIR = 'thumbs'
+
+# формат: (формат Pillow, расширение, content type)
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+# форматы, которые принимаются как исходные картинки
+SOURCE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+SOURCE_QUALITY = 90
+
+# сколько задача принадлежит взявшему ее обработчику
+TASK_LEASE = timedelta(minutes=5)
+TASK_RETRY_DELAY = timedelta(minutes=1)
+TASK_MAX_ATTEMPTS = 5
+
+
+class InvalidImage(Exception):
+    """Файл не является картинкой допустимого формата."""
+
+
+def get_widths():
+    return tuple(getattr(settings, 'RECIPE_IMAGE_WIDTHS', (320, 640, 1280)))
+
+
+def derivative_name(name, width, image_format):
+    """
+    Путь производной картинки в хранилище. Зависит только от имени
+    исходного файла, поэтому URL можно получить без обращения к диску.
+    """
+    stem = os.path.splitext(name)[0]
+    extension = FORMATS[image_format][1]
+    return f'{THUMBNAILS_DIR}/{stem}_{width}.{extension}'
+
+
+def derivative_url(name, width, image_format):
+    return default_storage.url(derivative_name(name, width, image_format))
+
+
+def resize(image, width):
+    """Уменьшает картинку до ширины width с сохранением пропорций."""
+    if image.width <= width:
+        return image.copy()
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def to_mode(image, image_format):
+    """JPEG без прозрачности: прозрачный фон заливается белым."""
+    has_alpha = image.mode in ('RGBA', 'LA') or (
+        image.mode == 'P' and 'transparency' in image.info)
+    if has_alpha and image_format == 'JPEG':
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    if has_alpha:
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def replace_file(name, content):
+    """Перезаписывает файл в хранилище, возвращает его итоговое имя."""
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    return default_storage.save(name, ContentFile(content))
+
+
+def decode(data):
+    """
+    Декодирует картинку целиком. Любая ошибка Pillow означает,
+    что файл битый или не картинка.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image_format = image.format
+        if image_format not in SOURCE_FORMATS:
+            raise InvalidImage(f'Неподдерживаемый формат {image_format}')
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    except InvalidImage:
+        raise
+    except Exception as error:
+        raise InvalidImage(str(error)) from error
+    return image, image_format
+
+
+def encode(image, image_format, quality):
+    buffer = io.BytesIO()
+    to_mode(image, image_format).save(buffer, image_format, quality=quality)
+    return buffer.getvalue()
+
+
+def process_image(name):
+    """
+    Проверяет загруженный файл, перекодирует его без метаданных
+    и создает уменьшенные копии всех ширин RECIPE_IMAGE_WIDTHS
+    в WebP и JPEG. Возвращает итоговое имя исходного файла.
+    """
+    with default_storage.open(name) as source:
+        data = source.read()
+    image, image_format = decode(data)
+    new_name = replace_file(
+        name, encode(image, image_format, SOURCE_QUALITY))
+    quality = getattr(settings, 'RECIPE_IMAGE_QUALITY', 80)
+    for width in get_widths():
+        thumbnail = resize(image, width)
+        for key, (derivative_format, _, _) in FORMATS.items():
+            replace_file(
+                derivative_name(new_name, width, key),
+                encode(thumbnail, derivative_format, quality),
+            )
+    return new_name
+
+
+def has_derivatives(name):
+    return all(
+        default_storage.exists(derivative_name(name, width, key))
+        for width in get_widths() for key in FORMATS
+    )
+
+
+def unprocessed_images(names):
+    """
+    Картинки из names, которые еще нужно обработать: ни один рецепт
+    с ними не готов и уменьшенных копий в хранилище нет.
+    """
+    names = set(names)
+    ready = set(Recipe.objects.filter(
+        image__in=names, image_status=Recipe.IMAGE_READY,
+    ).values_list('image', flat=True))
+    return {name for name in names - ready if not has_derivatives(name)}
+
+
+def enqueue_images(names):
+    """Ставит файлы в очередь обработки одним INSERT, без дублей."""
+    ImageTask.objects.bulk_create(
+        [ImageTask(image=name) for name in names], ignore_conflicts=True)
+
+
+def enqueue_image(name):
+    enqueue_images([name])
+
+
+def fail_exhausted(free):
+    """
+    Задачи, исчерпавшие попытки, но так и не завершенные (обработчик
+    упал посреди задачи), помечают рецепты статусом failed.
+    """
+    for task in ImageTask.objects.filter(
+            free, attempts__gte=TASK_MAX_ATTEMPTS):
+        logger.warning(
+            'Картинка %s не обработана за %s попыток: %s',
+            task.image, task.attempts, task.error)
+        finish_task(task, Recipe.IMAGE_FAILED)
+
+
+def claim_tasks(limit):
+    """
+    Забирает до limit свободных задач. На PostgreSQL задачи, которые
+    сейчас забирает другой обработчик, пропускаются (SKIP LOCKED).
+    """
+    now = timezone.now()
+    free = Q(locked_until__isnull=True) | Q(locked_until__lte=now)
+    fail_exhausted(free)
+    with transaction.atomic():
+        tasks = list(
+            ImageTask.objects.select_for_update(skip_locked=True)
+            .filter(free, attempts__lt=TASK_MAX_ATTEMPTS)[:limit]
+        )
+        ImageTask.objects.filter(pk__in=[task.pk for task in tasks]).update(
+            locked_until=now + TASK_LEASE,
+            attempts=F('attempts') + 1,
+        )
+    return tasks
+
+
+@transaction.atomic
+def finish_task(task, status, name=None):
+    recipes = Recipe.objects.filter(image=task.image)
+    if name is not None and name != task.image:
+        recipes.update(image=name, image_status=status)
+    else:
+        recipes.update(image_status=status)
+    ImageTask.objects.filter(pk=task.pk).delete()
+    transaction.on_commit(partial(bump_version, 'recipes'))
+
+
+def run_task(task):
+    """
+    Выполняет задачу. Битая картинка сразу помечает рецепты статусом
+    failed; любые другие ошибки (хранилища, Pillow) повторяются
+    до TASK_MAX_ATTEMPTS раз, а не роняют обработчик.
+    """
+    try:
+        name = process_image(task.image)
+    except InvalidImage as error:
+        logger.warning('Картинка %s отклонена: %s', task.image, error)
+        finish_task(task, Recipe.IMAGE_FAILED)
+        return False
+    except Exception as error:
+        logger.exception('Не удалось обработать картинку %s', task.image)
+        if task.attempts + 1 >= TASK_MAX_ATTEMPTS:
+            finish_task(task, Recipe.IMAGE_FAILED)
+        else:
+            ImageTask.objects.filter(pk=task.pk).update(
+                error=str(error),
+                locked_until=timezone.now() + TASK_RETRY_DELAY,
+            )
+        return False
+    finish_task(task, Recipe.IMAGE_READY, name)
+    return True
+
+
+def run_pending(limit):
+    """Обрабатывает до limit задач, возвращает (обработано, ошибок)."""
+    done = failed = 0
+    for task in claim_tasks(limit):
+        if run_task(task):
+            done += 1
+        else:
+            failed += 1
+    return done, failed
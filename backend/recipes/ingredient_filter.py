@@ -0,0 +1,66 @@
+from django.db import connections
+from django.db.models import BooleanField, Count, Exists, OuterRef
+from django.db.models.expressions import RawSQL
+
+from .versions import depends_on
+
+
+def postgresql_filter(queryset, table, include, exclude):
+    """
+    Фильтр по столбцу ingredient_ids (см. миграцию
+    0012_recipe_ingredient_ids): @> и && по массиву с GIN-индексом.
+    """
+    column = f'{table}.ingredient_ids'
+    # столбец пересчитывают триггеры на составе рецепта
+    queryset = depends_on(queryset, queryset.model.ingredients.through)
+    if include:
+        queryset = queryset.filter(RawSQL(
+            f'{column} @> %s::integer[]', (include,),
+            output_field=BooleanField(),
+        ))
+    if exclude:
+        queryset = queryset.filter(RawSQL(
+            f'NOT ({column} && %s::integer[])', (exclude,),
+            output_field=BooleanField(),
+        ))
+    return queryset
+
+
+def default_filter(queryset, table, include, exclude):
+    """
+    Фильтр по IngredientRecipe: рецепты со всеми ингридиентами
+    include ищутся одним GROUP BY по индексу (ingredient, recipe),
+    без JOIN и DISTINCT во внешнем запросе.
+    """
+    through = queryset.model.ingredients.through
+    if include:
+        queryset = queryset.filter(pk__in=through.objects.filter(
+            ingredient_id__in=include,
+        ).values('recipe_id').annotate(
+            found=Count('ingredient_id'),
+        ).filter(found=len(include)).values('recipe_id'))
+    if exclude:
+        queryset = queryset.filter(~Exists(through.objects.filter(
+            recipe_id=OuterRef('pk'), ingredient_id__in=exclude,
+        )))
+    return queryset
+
+
+BACKENDS = {
+    'postgresql': postgresql_filter,
+}
+
+
+def filter_by_ingredients(queryset, include=(), exclude=()):
+    """
+    Рецепты, в которых есть все ингридиенты include
+    и нет ни одного из exclude (id ингридиентов).
+    """
+    include = sorted(set(include))
+    exclude = sorted(set(exclude))
+    if not include and not exclude:
+        return queryset
+    connection = connections[queryset.db]
+    backend = BACKENDS.get(connection.vendor, default_filter)
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    return backend(queryset, table, include, exclude)
@@ -0,0 +1,101 @@
+import bisect
+import re
+import threading
+
+from django.conf import settings
+
+from .models import Ingredient
+from .versions import bump_version, get_version
+
+WHITESPACE = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_index = None
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска: регистр, ё/е, пробелы."""
+    return WHITESPACE.sub(' ', value.lower().replace('ё', 'е')).strip()
+
+
+class IngredientIndex:
+    """
+    Индекс ингридиентов для автодополнения.
+
+    Хранит отсортированный список нормализованных названий:
+    совпадения по префиксу находятся бинарным поиском,
+    совпадения по подстроке — проходом по списку.
+    """
+
+    def __init__(self, ingredients, version=None):
+        self.version = version
+        entries = sorted(
+            (normalize(name), {
+                'id': pk,
+                'name': name,
+                'measurement_unit': unit,
+            })
+            for pk, name, unit in ingredients
+        )
+        self.keys = [key for key, _ in entries]
+        self.items = [item for _, item in entries]
+
+    def search(self, query, limit):
+        query = normalize(query)
+        if not query or limit <= 0:
+            return []
+        start = bisect.bisect_left(self.keys, query)
+        end = start
+        while (end < len(self.keys) and end - start < limit
+               and self.keys[end].startswith(query)):
+            end += 1
+        result = self.items[start:end]
+        if len(result) >= limit:
+            return result
+        substring = []
+        for index, key in enumerate(self.keys):
+            position = key.find(query)
+            if position > 0:
+                substring.append((position, index))
+        substring.sort()
+        result.extend(
+            self.items[index]
+            for _, index in substring[:limit - len(result)]
+        )
+        return result
+
+
+def get_index():
+    """
+    Возвращает индекс текущего процесса, перестраивая его,
+    если каталог ингридиентов изменился.
+    """
+    global _index
+    version = get_version('ingredients')
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    with _lock:
+        if _index is None or _index.version != version:
+            _index = IngredientIndex(
+                Ingredient.objects.using('default').values_list(
+                    'pk', 'name', 'measurement_unit'),
+                version,
+            )
+        return _index
+
+
+def invalidate_index():
+    """
+    Сбрасывает индекс. Новая версия каталога заставляет перестроить
+    индекс и другие процессы, если кеш общий.
+    """
+    global _index
+    bump_version('ingredients')
+    _index = None
+
+
+def search_ingredients(query, limit=None):
+    if limit is None:
+        limit = getattr(settings, 'INGREDIENT_SEARCH_LIMIT', 20)
+    return get_index().search(query, limit)
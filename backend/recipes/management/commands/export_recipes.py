@@ -0,0 +1,41 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.transfer import EXPORT_CHUNK_SIZE, export_recipes, to_ndjson
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка рецептов с тегами и ингридиентами в NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='Файл для выгрузки, по умолчанию stdout',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        path = options['path']
+        output = (
+            sys.stdout if path == '-'
+            else open(path, 'w', encoding='UTF-8')
+        )
+        count = 0
+        try:
+            for line in to_ndjson(export_recipes(
+                    chunk_size=options['chunk_size'])):
+                output.write(line)
+                count += 1
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {count} '
+            f'за {time.perf_counter() - start:.1f} с'
+        ))
@@ -0,0 +1,239 @@
+import csv
+import itertools
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.images import enqueue_image
+from recipes.models import (
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    Tag,
+    UserFavoriteRecipes,
+    UserShoppingCartRecipes,
+)
+from users.models import Subscribe, User
+
+RECIPE_IMAGE = 'recipes/temp.png'
+LOREM = (
+    'Нарезать, смешать и довести до готовности. '
+    'Подавать горячим, посыпав зеленью. '
+    'Дать настояться несколько минут перед подачей. '
+)
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def skewed_weights(count, rnd):
+    """
+    Веса с «длинным хвостом»: немногие объекты очень популярны,
+    большинство — почти нет. Так распределены авторы и рецепты в проде.
+    """
+    return [rnd.paretovariate(1.2) for _ in range(count)]
+
+
+def sample_unique(population, cum_weights, k, rnd):
+    """Взвешенная выборка k разных элементов."""
+    k = min(k, len(population))
+    result = set()
+    while len(result) < k:
+        result.update(
+            rnd.choices(population, cum_weights=cum_weights,
+                        k=k - len(result))
+        )
+    return result
+
+
+class Command(BaseCommand):
+    help = 'Генерация синтетических данных для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--subscriptions-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=30)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        start = time.perf_counter()
+
+        ingredient_ids = list(
+            Ingredient.objects.values_list('pk', flat=True))
+        if not ingredient_ids:
+            raise CommandError(
+                'Нет ингридиентов, сначала выполните import_data')
+        tag_ids = self.get_tag_ids()
+
+        user_ids = self.create_users(options['users'])
+        recipe_ids = self.create_recipes(options['recipes'], user_ids)
+        # у всех рецептов одна картинка, ее обработает run_worker
+        enqueue_image(RECIPE_IMAGE)
+        self.create_recipe_tags(recipe_ids, tag_ids)
+        self.create_recipe_ingredients(recipe_ids, ingredient_ids)
+
+        author_ids = list(
+            Recipe.objects.values_list('author_id', flat=True).distinct())
+        self.create_pairs(
+            Subscribe, 'follower_id', 'following_id',
+            user_ids, author_ids, options['subscriptions_per_user'],
+            exclude_self=True,
+        )
+        self.create_pairs(
+            UserFavoriteRecipes, 'user_id', 'recipe_id',
+            user_ids, recipe_ids, options['favorites_per_user'],
+        )
+        self.create_pairs(
+            UserShoppingCartRecipes, 'user_id', 'recipe_id',
+            user_ids, recipe_ids, options['cart_per_user'],
+        )
+        # bulk_create не вызывает сигналы, счетчики и списки покупок
+        # считаем отдельно
+        call_command('reconcile_counters', stdout=self.stdout._out)
+        self.stdout.write(self.style.SUCCESS(
+            f'Данные сгенерированы за {time.perf_counter() - start:.1f} с'
+        ))
+
+    def bulk_insert(self, model, objects, total, return_ids=False,
+                    ignore_conflicts=False):
+        """
+        Вставляет объекты пачками по batch_size.
+        С return_ids возвращает id созданных строк в порядке вставки.
+        """
+        created_ids = []
+        done = 0
+        for batch in batched(objects, self.batch_size):
+            with transaction.atomic():
+                if return_ids:
+                    last_pk = model.objects.order_by('-pk').values_list(
+                        'pk', flat=True).first() or 0
+                model.objects.bulk_create(
+                    batch, ignore_conflicts=ignore_conflicts)
+                if return_ids:
+                    created_ids.extend(
+                        model.objects.filter(pk__gt=last_pk).order_by(
+                            'pk').values_list('pk', flat=True)
+                    )
+            done += len(batch)
+            self.stdout.write(
+                f'\r{model._meta.verbose_name_plural}: {done}/{total}',
+                ending='',
+            )
+            self.stdout.flush()
+        self.stdout.write('')
+        return created_ids
+
+    def get_tag_ids(self):
+        if not Tag.objects.exists():
+            with open(
+                f'{settings.BASE_DIR}/static/data/tags.csv',
+                'r', encoding='UTF-8'
+            ) as csv_file:
+                Tag.objects.bulk_create([
+                    Tag(name=name, color=color, slug=slug)
+                    for name, color, slug in csv.reader(csv_file)
+                ])
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def create_users(self, count):
+        offset = User.objects.count()
+        password = make_password(None)
+        users = (
+            User(
+                username=f'gen_user_{offset + i}',
+                email=f'gen_user_{offset + i}@foodgram.local',
+                first_name='Имя',
+                last_name='Фамилия',
+                password=password,
+            )
+            for i in range(count)
+        )
+        return self.bulk_insert(User, users, count, return_ids=True)
+
+    def create_recipes(self, count, user_ids):
+        rnd = self.rnd
+        weights = list(itertools.accumulate(
+            skewed_weights(len(user_ids), rnd)))
+        recipes = (
+            Recipe(
+                author_id=rnd.choices(user_ids, cum_weights=weights)[0],
+                name=f'Рецепт {i}',
+                text=LOREM * rnd.randint(1, 10),
+                cooking_time=rnd.randint(5, 180),
+                image=RECIPE_IMAGE,
+            )
+            for i in range(count)
+        )
+        return self.bulk_insert(Recipe, recipes, count, return_ids=True)
+
+    def create_recipe_tags(self, recipe_ids, tag_ids):
+        rnd = self.rnd
+        through = Recipe.tags.through
+        rows = (
+            through(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in recipe_ids
+            for tag_id in rnd.sample(tag_ids, rnd.randint(1, len(tag_ids)))
+        )
+        self.bulk_insert(through, rows, f'~{len(recipe_ids) * 2}')
+
+    def create_recipe_ingredients(self, recipe_ids, ingredient_ids):
+        rnd = self.rnd
+        weights = list(itertools.accumulate(
+            skewed_weights(len(ingredient_ids), rnd)))
+        rows = (
+            IngredientRecipe(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rnd.randint(1, 500),
+            )
+            for recipe_id in recipe_ids
+            for ingredient_id in sample_unique(
+                ingredient_ids, weights, rnd.randint(3, 15), rnd)
+        )
+        self.bulk_insert(IngredientRecipe, rows, f'~{len(recipe_ids) * 9}')
+
+    def create_pairs(self, model, owner_field, target_field,
+                     owner_ids, target_ids, per_owner, exclude_self=False):
+        """
+        Связи «пользователь → объект» (подписки, избранное, корзина):
+        у каждого пользователя в среднем per_owner уникальных объектов,
+        популярные объекты выбираются чаще.
+        """
+        if not target_ids or not per_owner:
+            return
+        rnd = self.rnd
+        weights = list(itertools.accumulate(
+            skewed_weights(len(target_ids), rnd)))
+
+        def rows():
+            for owner_id in owner_ids:
+                k = rnd.randint(0, per_owner * 2)
+                for target_id in sample_unique(
+                        target_ids, weights, k, rnd):
+                    if exclude_self and target_id == owner_id:
+                        continue
+                    yield model(**{
+                        owner_field: owner_id,
+                        target_field: target_id,
+                    })
+
+        self.bulk_insert(
+            model, rows(), f'~{len(owner_ids) * per_owner}',
+            ignore_conflicts=True,
+        )
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from recipes.images import enqueue_images, run_pending
+from recipes.models import Recipe
+
+# файлов в одном INSERT очереди
+ENQUEUE_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий (WebP и JPEG) картинок рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Пересоздать копии и для уже обработанных картинок',
+        )
+        parser.add_argument(
+            '--enqueue-only',
+            action='store_true',
+            help='Только поставить картинки в очередь для run_worker',
+        )
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        recipes = Recipe.objects.exclude(image='')
+        if not options['force']:
+            recipes = recipes.exclude(image_status=Recipe.IMAGE_READY)
+        names = list(
+            recipes.order_by('image').values_list('image', flat=True)
+            .distinct()
+        )
+        for offset in range(0, len(names), ENQUEUE_BATCH_SIZE):
+            enqueue_images(names[offset:offset + ENQUEUE_BATCH_SIZE])
+        if options['enqueue_only']:
+            self.stdout.write(self.style.SUCCESS(
+                f'В очередь поставлено картинок: {len(names)}'))
+            return
+        done = failed = 0
+        while True:
+            batch_done, batch_failed = run_pending(options['batch_size'])
+            if not batch_done and not batch_failed:
+                break
+            done += batch_done
+            failed += batch_failed
+            self.stdout.write(
+                f'\rКартинки: {done + failed}/{len(names)}', ending='')
+            self.stdout.flush()
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'Превью созданы за {time.perf_counter() - start:.1f} с: '
+            f'картинок {done}, с ошибками {failed}'
+        ))
@@ -1,28 +1,150 @@
 import csv
+import io
+import itertools
+import json
+import os
+import time
+
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from recipes.ingredient_index import invalidate_index
 from recipes.models import Ingredient
 
-TABLES_DICT = {
-    Ingredient: 'ingredients.csv'
+DEFAULT_PATH = os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv')
+
+
+def read_csv(path):
+    with open(path, 'r', encoding='UTF-8', newline='') as csv_file:
+        for row in csv.reader(csv_file):
+            if row:
+                yield row[0].strip(), row[1].strip()
+
+
+def read_json(path):
+    with open(path, 'r', encoding='UTF-8') as json_file:
+        for item in json.load(json_file):
+            yield item['name'].strip(), item['measurement_unit'].strip()
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
 }
 
 
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
 class Command(BaseCommand):
-    help = 'Загрузка данных из csv файлов'
-
-    def handle(self, *args, **kwargs):
-        for model, base in TABLES_DICT.items():
-            with open(
-                f'{settings.BASE_DIR}/static/data/{base}',
-                'r', encoding='UTF-8'
-            ) as csv_file:
-                reader = csv.reader(csv_file)
-                [model.objects.create(
-                    name=data[0],
-                    measurement_unit=data[1]
-                ) for data in reader]
-        self.stdout.write(
-            self.style.SUCCESS('Данные ингридиентов успешно загружены')
+    help = 'Загрузка и синхронизация ингридиентов из csv или json файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=DEFAULT_PATH,
+            help='Путь к ingredients.csv или ingredients.json',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--prune',
+            action='store_true',
+            help='Удалить ингридиенты, которых нет в файле '
+                 'и которые не используются в рецептах',
         )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY на PostgreSQL',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        reader = READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только .csv и .json файлы')
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        start = time.perf_counter()
+
+        existing = {
+            name: (pk, unit)
+            for pk, name, unit in Ingredient.objects.values_list(
+                'pk', 'name', 'measurement_unit')
+        }
+        seen = set()
+        to_create = []
+        to_update = []
+        duplicates = 0
+        for name, unit in reader(path):
+            if name in seen:
+                duplicates += 1
+                continue
+            seen.add(name)
+            if name not in existing:
+                to_create.append((name, unit))
+            elif existing[name][1] != unit:
+                to_update.append(
+                    Ingredient(pk=existing[name][0], measurement_unit=unit))
+
+        batch_size = options['batch_size']
+        with transaction.atomic():
+            if (to_create and connection.vendor == 'postgresql'
+                    and not options['no_copy']):
+                self.copy_insert(to_create)
+            else:
+                for batch in batched(to_create, batch_size):
+                    Ingredient.objects.bulk_create(
+                        [Ingredient(name=name, measurement_unit=unit)
+                         for name, unit in batch],
+                        ignore_conflicts=True,
+                    )
+            Ingredient.objects.bulk_update(
+                to_update, ['measurement_unit'], batch_size=batch_size)
+            deleted = 0
+            if options['prune']:
+                deleted, _ = Ingredient.objects.exclude(
+                    name__in=seen).filter(recipe__isnull=True).delete()
+            transaction.on_commit(invalidate_index)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Ингридиенты синхронизированы за '
+            f'{time.perf_counter() - start:.3f} с: '
+            f'добавлено {len(to_create)}, обновлено {len(to_update)}, '
+            f'удалено {deleted}, без изменений '
+            f'{len(seen) - len(to_create) - len(to_update)}, '
+            f'дубликатов в файле {duplicates}'
+        ))
+
+    def copy_insert(self, rows):
+        """
+        Загрузка новых строк через COPY во временную таблицу
+        и INSERT ... ON CONFLICT DO NOTHING в основную.
+        """
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(10)) '
+                'ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_import FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT name, measurement_unit FROM ingredient_import '
+                f'ON CONFLICT (name) DO NOTHING'
+            )
@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from recipes.transfer import IMPORT_BATCH_SIZE, import_recipes
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Загрузка рецептов из NDJSON (формат export_recipes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='Файл NDJSON или - для чтения из stdin',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            '--author',
+            help='Email автора для рецептов, автора которых нет в базе',
+        )
+
+    def handle(self, *args, **options):
+        author = None
+        if options['author']:
+            author = User.objects.filter(email=options['author']).first()
+            if author is None:
+                raise CommandError(
+                    f'Пользователь {options["author"]} не найден')
+        path = options['path']
+        if path != '-' and not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        start = time.perf_counter()
+        source = (
+            sys.stdin if path == '-'
+            else open(path, 'r', encoding='UTF-8')
+        )
+        try:
+            result = import_recipes(
+                source, default_author=author,
+                batch_size=options['batch_size'],
+            )
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        for error in result['errors']:
+            self.stderr.write(
+                f'Строка {error["line"]}: {"; ".join(error["errors"])}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецепты загружены за {time.perf_counter() - start:.1f} с: '
+            f'создано {result["created"]}, с ошибками {result["failed"]}'
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.cart import rebuild_shopping_lists
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчет счетчиков избранного, корзин, рецептов и подписчиков '
+        'и списков покупок'
+    )
+
+    def handle(self, *args, **kwargs):
+        start = time.perf_counter()
+        with transaction.atomic():
+            updated = reconcile_counters()
+            items = rebuild_shopping_lists()
+        for model, field, rows in updated:
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}.{field}: {rows}')
+        self.stdout.write(f'Позиций в списках покупок: {items}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики пересчитаны за {time.perf_counter() - start:.1f} с'
+        ))
@@ -0,0 +1,45 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from recipes.images import run_pending
+
+
+class Command(BaseCommand):
+    help = (
+        'Фоновый обработчик картинок рецептов: проверка, '
+        'перекодирование и создание уменьшенных копий'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10)
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=2,
+            help='Пауза в секундах, когда очередь пуста',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Разобрать очередь и завершиться',
+        )
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        self.stdout.write('Обработчик картинок запущен')
+        try:
+            while True:
+                close_old_connections()
+                done, failed = run_pending(options['batch_size'])
+                if done or failed:
+                    self.stdout.write(
+                        f'Обработано картинок: {done}, с ошибками {failed}')
+                    continue
+                if options['once']:
+                    return
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Обработчик картинок остановлен')
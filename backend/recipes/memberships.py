@@ -0,0 +1,95 @@
+import bisect
+import threading
+from array import array
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import IntegerField, Value
+
+from .models import UserFavoriteRecipes, UserShoppingCartRecipes
+from .versions import get_version
+
+FAVORITES = 0
+CART = 1
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+
+def flags_version(user_id):
+    """
+    Версия избранного, корзины и подписок пользователя,
+    меняется при их записи (см. recipes.signals).
+    """
+    return f'recipe_flags:{user_id}'
+
+
+class IdSet:
+    """Множество id в отсортированном массиве: 8 байт на элемент."""
+
+    def __init__(self, ids):
+        self.ids = array('q', sorted(ids))
+
+    def __contains__(self, value):
+        index = bisect.bisect_left(self.ids, value)
+        return index < len(self.ids) and self.ids[index] == value
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class Memberships:
+    """Рецепты в избранном и в корзине пользователя."""
+
+    def __init__(self, favorited=(), in_cart=(), version=None):
+        self.favorited = IdSet(favorited)
+        self.in_cart = IdSet(in_cart)
+        self.version = version
+
+
+EMPTY = Memberships()
+
+
+def load_memberships(user_id, version):
+    """Избранное и корзина одним запросом (UNION ALL)."""
+    kind = IntegerField()
+    # с основной базы: наборы хранятся до смены версии
+    # (см. foodgram.db_router)
+    rows = UserFavoriteRecipes.objects.using('default').filter(
+        user_id=user_id,
+    ).values_list(
+        'recipe_id', Value(FAVORITES, output_field=kind),
+    ).union(
+        UserShoppingCartRecipes.objects.filter(user_id=user_id).values_list(
+            'recipe_id', Value(CART, output_field=kind),
+        ),
+        all=True,
+    )
+    ids = ([], [])
+    for recipe_id, which in rows:
+        ids[which].append(recipe_id)
+    return Memberships(*ids, version=version)
+
+
+def get_memberships(user):
+    """
+    Избранное и корзина пользователя из памяти процесса. Перечитываются
+    из базы, только если сменилась версия; в памяти держатся
+    RECIPE_MEMBERSHIP_CACHE_SIZE последних пользователей.
+    """
+    if not user.is_authenticated:
+        return EMPTY
+    version = get_version(flags_version(user.pk))
+    with _lock:
+        memberships = _cache.get(user.pk)
+        if memberships is not None and memberships.version == version:
+            _cache.move_to_end(user.pk)
+            return memberships
+    memberships = load_memberships(user.pk, version)
+    with _lock:
+        _cache[user.pk] = memberships
+        _cache.move_to_end(user.pk)
+        size = getattr(settings, 'RECIPE_MEMBERSHIP_CACHE_SIZE', 1000)
+        while len(_cache) > size:
+            _cache.popitem(last=False)
+    return memberships
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumbnails',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Превью созданы'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.2.16 on 2026-10-18 04:16
+
+from django.db import migrations, models
+
+
+def fill_image_status(apps, schema_editor):
+    """
+    Картинки с уже созданными превью считаются обработанными,
+    остальные ставятся в очередь run_worker.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ImageTask = apps.get_model('recipes', 'ImageTask')
+    Recipe.objects.filter(image_thumbnails=True).update(image_status='ready')
+    names = (
+        Recipe.objects.filter(image_status='pending').exclude(image='')
+        .order_by('image').values_list('image', flat=True).distinct()
+    )
+    ImageTask.objects.bulk_create(
+        [ImageTask(image=name) for name in names],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_recipe_image_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.CharField(max_length=100, unique=True, verbose_name='Файл')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('locked_until', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Занята обработчиком до')),
+                ('error', models.TextField(blank=True, verbose_name='Последняя ошибка')),
+            ],
+            options={
+                'verbose_name': 'Обработка картинки',
+                'verbose_name_plural': 'Обработка картинок',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_status',
+            field=models.CharField(choices=[('pending', 'Обрабатывается'), ('ready', 'Готова'), ('failed', 'Ошибка')], default='pending', editable=False, max_length=7, verbose_name='Обработка картинки'),
+        ),
+        migrations.RunPython(fill_image_status, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='recipe',
+            name='image_thumbnails',
+        ),
+    ]
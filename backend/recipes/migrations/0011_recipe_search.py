@@ -0,0 +1,96 @@
+from django.db import migrations
+
+
+def without_yo(column):
+    """Ни русский стеммер PostgreSQL, ни FTS5 не приравнивают ё к е."""
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+POSTGRESQL_FORWARD = (
+    # столбец вычисляется самой базой при каждой записи строки
+    f"""
+    ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('russian', {without_yo('name')}), 'A')
+        || setweight(to_tsvector('russian', {without_yo('text')}), 'B')
+    ) STORED
+    """,
+    """
+    CREATE INDEX recipe_search_vector_idx
+    ON recipes_recipe USING GIN (search_vector)
+    """,
+)
+POSTGRESQL_BACKWARD = (
+    'DROP INDEX IF EXISTS recipe_search_vector_idx',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector',
+)
+
+# Таблица FTS5 хранит только индекс (content=''), триггеры
+# поддерживают его при записи в рецепты. Удаление из такой таблицы
+# требует тех же значений, что были вставлены. Если миграция
+# пересоздаст таблицу рецептов на SQLite, триггеры вернет обработчик
+# post_migrate (recipes.search.restore_fts_triggers).
+FTS_VALUES = f"{without_yo('{row}.name')}, {without_yo('{row}.text')}"
+FTS_INSERT = (
+    'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    f'VALUES (new.id, {FTS_VALUES.format(row="new")});'
+)
+FTS_DELETE = (
+    'INSERT INTO recipes_recipe_fts (recipes_recipe_fts, rowid, name, text) '
+    f"VALUES ('delete', old.id, {FTS_VALUES.format(row='old')});"
+)
+SQLITE_FORWARD = (
+    """
+    CREATE VIRTUAL TABLE recipes_recipe_fts USING fts5(
+        name, text, content='', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    'CREATE TRIGGER recipes_recipe_fts_insert AFTER INSERT ON recipes_recipe '
+    f'BEGIN {FTS_INSERT} END',
+    'CREATE TRIGGER recipes_recipe_fts_delete AFTER DELETE ON recipes_recipe '
+    f'BEGIN {FTS_DELETE} END',
+    'CREATE TRIGGER recipes_recipe_fts_update '
+    'AFTER UPDATE OF name, text ON recipes_recipe '
+    f'BEGIN {FTS_DELETE} {FTS_INSERT} END',
+    'INSERT INTO recipes_recipe_fts (rowid, name, text) '
+    f'SELECT id, {FTS_VALUES.format(row="recipes_recipe")} '
+    'FROM recipes_recipe',
+)
+SQLITE_BACKWARD = (
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_insert',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_delete',
+    'DROP TRIGGER IF EXISTS recipes_recipe_fts_update',
+    'DROP TABLE IF EXISTS recipes_recipe_fts',
+)
+
+STATEMENTS = {
+    'postgresql': (POSTGRESQL_FORWARD, POSTGRESQL_BACKWARD),
+    'sqlite': (SQLITE_FORWARD, SQLITE_BACKWARD),
+}
+
+
+def execute(schema_editor, index):
+    statements = STATEMENTS.get(schema_editor.connection.vendor)
+    if statements is None:
+        return
+    for sql in statements[index]:
+        schema_editor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    execute(schema_editor, 0)
+
+
+def drop_search_index(apps, schema_editor):
+    execute(schema_editor, 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_imageupload'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,103 @@
+from django.db import migrations
+
+# Массив id ингридиентов рецепта с GIN-индексом — инвертированный
+# индекс ингридиент -> рецепты для фильтров ?ingredients= и
+# ?exclude_ingredients=. Массив пересчитывает триггер на уровне
+# оператора, поэтому bulk_create и удаление queryset тоже учтены.
+# На других базах фильтр работает по IngredientRecipe.
+INGREDIENT_IDS = (
+    'ARRAY(SELECT ingredient_id FROM recipes_ingredientrecipe '
+    'WHERE recipe_id = recipes_recipe.id ORDER BY ingredient_id)'
+)
+
+FORWARD = (
+    """
+    ALTER TABLE recipes_recipe
+    ADD COLUMN ingredient_ids integer[] NOT NULL DEFAULT '{}'
+    """,
+    f'UPDATE recipes_recipe SET ingredient_ids = {INGREDIENT_IDS}',
+    """
+    CREATE INDEX recipe_ingredient_ids_idx
+    ON recipes_recipe USING GIN (ingredient_ids)
+    """,
+    f"""
+    CREATE FUNCTION recipe_ingredient_ids_refresh() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            UPDATE recipes_recipe SET ingredient_ids = {INGREDIENT_IDS}
+            WHERE id IN (SELECT recipe_id FROM new_rows);
+        ELSIF TG_OP = 'DELETE' THEN
+            UPDATE recipes_recipe SET ingredient_ids = {INGREDIENT_IDS}
+            WHERE id IN (SELECT recipe_id FROM old_rows);
+        ELSE
+            -- изменение количества состав рецепта не меняет
+            UPDATE recipes_recipe SET ingredient_ids = {INGREDIENT_IDS}
+            WHERE id IN (
+                SELECT changed.recipe_id
+                FROM old_rows o JOIN new_rows n ON n.id = o.id,
+                LATERAL (VALUES (o.recipe_id), (n.recipe_id))
+                    AS changed (recipe_id)
+                WHERE o.ingredient_id <> n.ingredient_id
+                    OR o.recipe_id <> n.recipe_id
+            );
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER recipe_ingredient_ids_insert
+    AFTER INSERT ON recipes_ingredientrecipe
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredient_ids_refresh()
+    """,
+    """
+    CREATE TRIGGER recipe_ingredient_ids_delete
+    AFTER DELETE ON recipes_ingredientrecipe
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredient_ids_refresh()
+    """,
+    """
+    CREATE TRIGGER recipe_ingredient_ids_update
+    AFTER UPDATE ON recipes_ingredientrecipe
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_ingredient_ids_refresh()
+    """,
+)
+BACKWARD = (
+    'DROP TRIGGER IF EXISTS recipe_ingredient_ids_insert '
+    'ON recipes_ingredientrecipe',
+    'DROP TRIGGER IF EXISTS recipe_ingredient_ids_delete '
+    'ON recipes_ingredientrecipe',
+    'DROP TRIGGER IF EXISTS recipe_ingredient_ids_update '
+    'ON recipes_ingredientrecipe',
+    'DROP FUNCTION IF EXISTS recipe_ingredient_ids_refresh()',
+    'DROP INDEX IF EXISTS recipe_ingredient_ids_idx',
+    'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS ingredient_ids',
+)
+
+
+def execute(schema_editor, statements):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def create_ingredient_ids(apps, schema_editor):
+    execute(schema_editor, FORWARD)
+
+
+def drop_ingredient_ids(apps, schema_editor):
+    execute(schema_editor, BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_ingredient_ids, drop_ingredient_ids),
+    ]
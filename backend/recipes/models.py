@@ -1,5 +1,14 @@
+import uuid
+
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Exists, F, OuterRef, Prefetch, Value, Window
+from django.db.models.functions import RowNumber
+
+from users.models import Subscribe
+
+from .ingredient_filter import filter_by_ingredients
+from .search import search_recipes
 
 User = get_user_model()
 
@@ -48,6 +57,76 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_related(self, user):
+        """
+        Подгружает автора (с флагом is_subscribed), теги и ингридиенты
+        фиксированным числом запросов независимо от размера выборки.
+        """
+        if user.is_authenticated:
+            is_subscribed = Exists(Subscribe.objects.filter(
+                follower=user, following=OuterRef('pk')))
+        else:
+            is_subscribed = Value(False, output_field=models.BooleanField())
+        return self.prefetch_related(
+            Prefetch(
+                'author',
+                queryset=User.objects.annotate(is_subscribed=is_subscribed)
+            ),
+            'tags',
+            Prefetch(
+                'ingredientrecipe_set',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            ),
+        )
+
+    def for_read(self, user):
+        """
+        Выборка для RecipeSerializer. Флаги is_favorited
+        и is_in_shopping_cart берутся из recipes.memberships.
+        """
+        return self.with_related(user)
+
+    def with_ingredients(self, include=(), exclude=()):
+        """Рецепты со всеми ингридиентами include и без exclude."""
+        return filter_by_ingredients(self, include, exclude)
+
+    def search(self, query):
+        """Полнотекстовый поиск с сортировкой по релевантности."""
+        return search_recipes(self, query)
+
+    def latest_by_author(self, author_ids, limit=None):
+        """
+        Последние limit рецептов каждого автора одним запросом
+        (ROW_NUMBER() OVER (PARTITION BY author)).
+        Возвращает словарь {id автора: [рецепты]}.
+        """
+        queryset = self.filter(author_id__in=author_ids).only(
+            'id', 'author_id', 'name', 'image', 'image_status',
+            'cooking_time', 'pub_date')
+        if limit is None:
+            recipes = queryset.order_by('author_id', '-pub_date', '-id')
+        else:
+            queryset = queryset.order_by().annotate(
+                recipe_rank=Window(
+                    expression=RowNumber(),
+                    partition_by=[F('author_id')],
+                    order_by=[F('pub_date').desc(), F('id').desc()],
+                )
+            )
+            sql, params = queryset.query.sql_with_params()
+            recipes = self.model.objects.raw(
+                f'SELECT * FROM ({sql}) latest WHERE recipe_rank <= %s '
+                f'ORDER BY author_id, recipe_rank',
+                (*params, limit),
+            )
+        result = {}
+        for recipe in recipes:
+            result.setdefault(recipe.author_id, []).append(recipe)
+        return result
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -71,32 +150,71 @@ class Recipe(models.Model):
         "Дата добавления",
         auto_now_add=True
     )
+    favorites_count = models.PositiveIntegerField(
+        "В избранном",
+        default=0,
+        editable=False,
+    )
+    cart_count = models.PositiveIntegerField(
+        "В корзинах",
+        default=0,
+        editable=False,
+    )
+    # меняются атомарным UPDATE-ом, save() их не записывает
+    COUNTER_FIELDS = ('favorites_count', 'cart_count')
+    IMAGE_PENDING = 'pending'
+    IMAGE_READY = 'ready'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUSES = (
+        (IMAGE_PENDING, 'Обрабатывается'),
+        (IMAGE_READY, 'Готова'),
+        (IMAGE_FAILED, 'Ошибка'),
+    )
+    image_status = models.CharField(
+        "Обработка картинки",
+        max_length=7,
+        choices=IMAGE_STATUSES,
+        default=IMAGE_PENDING,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'],
+                name='recipe_pub_date_id_idx',
+            ),
+            # фильтр ?author= с сортировкой по дате
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='recipe_author_pub_date_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
-    @property
-    def is_favorited(self, request):
-        if request.user.is_authenticated:
-            return UserFavoriteRecipes.objects.get(
-                recipe=self,
-                user=request.user
-            ).exists()
-        return False
-
-    @property
-    def is_in_shopping_cart(self, request):
-        if request.user.is_authenticated:
-            return UserShoppingCartRecipes.objects.get(
-                recipe=self,
-                user=request.user,
-            ).exists()
-        return False
+    def save(self, *args, **kwargs):
+        """
+        Обновление существующего рецепта (API, админка) не записывает
+        счетчики: значения, прочитанные в начале запроса, затерли бы
+        изменения, сделанные за это время (см. recipes.counters).
+        """
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.COUNTER_FIELDS
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
 
 
 class IngredientRecipe(models.Model):
@@ -162,3 +280,91 @@ class UserShoppingCartRecipes(models.Model):
 
     def __str__(self):
         return f'Рецепт - {self.recipe} в корзине у {self.user}'
+
+
+class ShoppingListItem(models.Model):
+    """
+    Итоговое количество ингридиента в списке покупок пользователя.
+    Поддерживается при изменении корзины и состава рецептов
+    (см. recipes.cart), чтобы скачивание списка было одним запросом.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name="Ингридиент",
+    )
+    total_amount = models.PositiveIntegerField("Количество")
+
+    class Meta:
+        unique_together = ('user', 'ingredient')
+        verbose_name = "Позиция списка покупок"
+        verbose_name_plural = "Список покупок"
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} {self.total_amount}'
+
+
+class ImageTask(models.Model):
+    """
+    Задача фоновой обработки загруженной картинки: проверка,
+    перекодирование и создание уменьшенных копий (см. recipes.images
+    и команду run_worker). Одна задача на файл, даже если он
+    у нескольких рецептов.
+    """
+    image = models.CharField("Файл", max_length=100, unique=True)
+    created = models.DateTimeField("Создана", auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    locked_until = models.DateTimeField(
+        "Занята обработчиком до",
+        null=True,
+        blank=True,
+        db_index=True,
+    )
+    error = models.TextField("Последняя ошибка", blank=True)
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Обработка картинки"
+        verbose_name_plural = "Обработка картинок"
+
+    def __str__(self):
+        return self.image
+
+
+class ImageUpload(models.Model):
+    """
+    Картинка, загружаемая через /api/uploads/ целиком (multipart)
+    или частями (PUT с Content-Range). Завершенную загрузку можно
+    передать токеном в поле image рецепта.
+    """
+    token = models.UUIDField(
+        "Токен",
+        default=uuid.uuid4,
+        unique=True,
+        editable=False,
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="image_uploads",
+    )
+    filename = models.CharField("Имя файла", max_length=255)
+    size = models.PositiveBigIntegerField("Получено байт", default=0)
+    total_size = models.PositiveBigIntegerField("Размер файла")
+    created = models.DateTimeField("Создана", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Загрузка картинки"
+        verbose_name_plural = "Загрузки картинок"
+
+    def __str__(self):
+        return f'{self.filename} ({self.size}/{self.total_size})'
+
+    @property
+    def completed(self):
+        return self.size == self.total_size
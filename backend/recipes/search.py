@@ -0,0 +1,149 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+# конфигурация PostgreSQL, с которой построен столбец search_vector
+# (см. миграцию 0011_recipe_search)
+SEARCH_CONFIG = 'russian'
+FTS_TABLE = 'recipes_recipe_fts'
+# вес совпадения в названии против совпадения в описании для bm25
+FTS_WEIGHTS = (10.0, 1.0)
+
+WORDS = re.compile(r'\w+')
+# окончания, которые отбрасываются вместо стемминга в FTS5
+ENDINGS = 'аеийоуыьэюя'
+MIN_STEM = 3
+
+
+def without_yo(value):
+    """Индексы строятся по тексту с ё, замененной на е."""
+    return value.replace('ё', 'е').replace('Ё', 'Е')
+
+
+def sql_without_yo(column):
+    return f"replace(replace({column}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+# триггеры, которыми SQLite поддерживает таблицу FTS5
+# (как в миграции 0011_recipe_search)
+FTS_VALUES = (
+    f"{sql_without_yo('{row}.name')}, {sql_without_yo('{row}.text')}")
+FTS_INSERT = (
+    f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+    f'VALUES (new.id, {FTS_VALUES.format(row="new")});'
+)
+FTS_DELETE = (
+    f'INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, name, text) '
+    f"VALUES ('delete', old.id, {FTS_VALUES.format(row='old')});"
+)
+FTS_TRIGGERS = {
+    'recipes_recipe_fts_insert':
+        f'AFTER INSERT ON recipes_recipe BEGIN {FTS_INSERT} END',
+    'recipes_recipe_fts_delete':
+        f'AFTER DELETE ON recipes_recipe BEGIN {FTS_DELETE} END',
+    'recipes_recipe_fts_update':
+        'AFTER UPDATE OF name, text ON recipes_recipe '
+        f'BEGIN {FTS_DELETE} {FTS_INSERT} END',
+}
+
+
+def restore_fts_triggers(connection):
+    """
+    Возвращает пропавшие триггеры FTS5 и перестраивает индекс.
+
+    Изменяя столбцы таблицы рецептов, редактор схемы Django на SQLite
+    пересоздает ее копированием, и триггеры старой таблицы исчезают
+    без ошибок. Записи, сделанные без триггеров, в индекс не попали,
+    поэтому он строится заново. Возвращает имена восстановленных
+    триггеров.
+    """
+    if connection.vendor != 'sqlite':
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master "
+            "WHERE name = %s OR tbl_name = 'recipes_recipe'", [FTS_TABLE])
+        existing = {name for name, in cursor.fetchall()}
+        if FTS_TABLE not in existing:
+            return []
+        missing = [name for name in FTS_TRIGGERS if name not in existing]
+        if not missing:
+            return []
+        for name in missing:
+            cursor.execute(f'CREATE TRIGGER {name} {FTS_TRIGGERS[name]}')
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('delete-all')")
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, name, text) '
+            f'SELECT id, {FTS_VALUES.format(row="recipes_recipe")} '
+            'FROM recipes_recipe')
+    return missing
+
+
+def fts_query(query):
+    """
+    Запрос FTS5 из пользовательской строки: слова в кавычках
+    (операторы FTS5 не интерпретируются) без гласных окончаний
+    и с поиском по префиксу. Это грубо заменяет отсутствующий
+    в SQLite русский стеммер: «свекла» найдет и «свеклы».
+    """
+    terms = []
+    for word in WORDS.findall(without_yo(query).lower()):
+        stem = word.rstrip(ENDINGS)
+        if len(stem) >= MIN_STEM:
+            word = stem
+        terms.append(f'"{word}"*')
+    return ' '.join(terms)
+
+
+def postgresql_search(queryset, table, query):
+    vector = f'{table}.search_vector'
+    tsquery = 'websearch_to_tsquery(%s::regconfig, %s)'
+    params = (SEARCH_CONFIG, without_yo(query))
+    return queryset.filter(RawSQL(
+        f'{vector} @@ {tsquery}', params, output_field=BooleanField(),
+    )).annotate(search_rank=RawSQL(
+        f'ts_rank({vector}, {tsquery})', params, output_field=FloatField(),
+    ))
+
+
+def sqlite_search(queryset, table, query):
+    match = fts_query(query)
+    if not match:
+        return queryset.none()
+    # соединение с таблицей FTS5: bm25 считается за один проход
+    # по совпадениям и тем меньше, чем документ релевантнее
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+        select={'search_rank': f'-bm25({FTS_TABLE}, {weights})'},
+    )
+
+
+BACKENDS = {
+    'postgresql': postgresql_search,
+    'sqlite': sqlite_search,
+}
+
+
+def search_recipes(queryset, query):
+    """
+    Рецепты, в названии или описании которых есть слова запроса,
+    от более релевантных к менее (совпадение в названии весит больше).
+
+    На PostgreSQL поиск идет по столбцу tsvector с GIN-индексом,
+    на SQLite — по таблице FTS5. Оба индекса обновляет сама база
+    при любой записи в рецепты, в том числе bulk_create и update().
+    """
+    connection = connections[queryset.db]
+    backend = BACKENDS.get(connection.vendor)
+    if backend is None:
+        raise NotImplementedError(
+            f'Полнотекстовый поиск не поддерживается для {connection.vendor}')
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    return backend(queryset, table, query).order_by(
+        '-search_rank', '-pub_date', '-id')
@@ -0,0 +1,221 @@
+import logging
+from functools import partial
+
+from django.db import connections, transaction
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_migrate,
+    post_save,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from users.models import Subscribe, User
+
+from . import cart
+from .counters import change_counter
+from .images import enqueue_image
+from .ingredient_index import invalidate_index
+from .memberships import flags_version
+from .search import restore_fts_triggers
+from .models import (
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    Tag,
+    UserFavoriteRecipes,
+    UserShoppingCartRecipes,
+)
+from .versions import bump_version
+
+logger = logging.getLogger(__name__)
+
+# модель связи: (модель со счетчиком, внешний ключ, поле счетчика)
+COUNTED_RELATIONS = {
+    UserFavoriteRecipes: (Recipe, 'recipe_id', 'favorites_count'),
+    UserShoppingCartRecipes: (Recipe, 'recipe_id', 'cart_count'),
+    Recipe: (User, 'author_id', 'recipes_count'),
+    Subscribe: (User, 'following_id', 'followers_count'),
+}
+# поля пользователя, которые выводятся у автора рецепта
+AUTHOR_FIELDS = {'email', 'username', 'first_name', 'last_name'}
+# связь: владелец флага (is_favorited, is_in_shopping_cart, is_subscribed)
+FLAG_OWNERS = {
+    UserFavoriteRecipes: 'user_id',
+    UserShoppingCartRecipes: 'user_id',
+    Subscribe: 'follower_id',
+}
+
+
+@receiver(post_migrate)
+def search_triggers(sender, using, **kwargs):
+    """Триггеры поиска на SQLite после миграций (см. recipes.search)."""
+    if sender.name != 'recipes':
+        return
+    restored = restore_fts_triggers(connections[using])
+    if restored:
+        logger.warning(
+            'Восстановлены триггеры поиска: %s', ', '.join(restored))
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    transaction.on_commit(invalidate_index)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    transaction.on_commit(partial(bump_version, 'tags'))
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_delete, sender=IngredientRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_changed(sender, action='post_', **kwargs):
+    """Сбрасывает кеш ответов с рецептами (см. api.response_cache)."""
+    if action.startswith('post_'):
+        transaction.on_commit(partial(bump_version, 'recipes'))
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, created, update_fields=None, **kwargs):
+    if created or (
+            update_fields is not None
+            and not AUTHOR_FIELDS.intersection(update_fields)):
+        return
+    transaction.on_commit(partial(bump_version, 'recipes'))
+
+
+def flags_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает избранное и корзину пользователя в памяти процессов
+    (recipes.memberships) и его флаги в кеше ответов.
+    """
+    user_id = getattr(instance, FLAG_OWNERS[sender])
+    transaction.on_commit(partial(bump_version, flags_version(user_id)))
+
+
+@receiver(post_init, sender=UserShoppingCartRecipes)
+def remember_cart_row(sender, instance, **kwargs):
+    fields = instance.__dict__
+    instance._loaded_row = (
+        fields.get('user_id'), fields.get('recipe_id'),
+    ) if instance.pk else None
+
+
+@receiver(post_save, sender=UserShoppingCartRecipes)
+def cart_recipe_saved(sender, instance, created, **kwargs):
+    """
+    Списки покупок меняются при любой записи в корзину и состав
+    рецепта: из API, админки или ORM (см. recipes.cart).
+    """
+    old = None if created else instance._loaded_row
+    new = (instance.user_id, instance.recipe_id)
+    instance._loaded_row = new
+    if old == new:
+        return
+    if old and None not in old and not cart.is_handled(old[1]):
+        cart.remove_recipe(*old)
+    if not cart.is_handled(new[1]):
+        cart.add_recipe(*new)
+
+
+@receiver(post_delete, sender=UserShoppingCartRecipes)
+def cart_recipe_deleted(sender, instance, **kwargs):
+    # при удалении рецепта строки состава и корзины удаляются
+    # в любом порядке: что удалено раньше, то уже не учитывается
+    if not cart.is_handled(instance.recipe_id):
+        cart.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+def ingredient_row(instance):
+    return (instance.recipe_id, instance.ingredient_id, instance.amount)
+
+
+def change_ingredient_row(old, new):
+    """
+    Переносит в списки покупок замену строки состава old на new
+    (рецепт, ингридиент, количество; None — строки нет).
+    """
+    changes = {}
+    for side, row in enumerate((old, new)):
+        if row is None or None in row or cart.is_handled(row[0]):
+            continue
+        recipe_id, ingredient_id, amount = row
+        changes.setdefault(recipe_id, ({}, {}))[side][ingredient_id] = amount
+    for recipe_id, (before, after) in changes.items():
+        cart.recipe_changed(recipe_id, before, after)
+
+
+@receiver(post_init, sender=IngredientRecipe)
+def remember_ingredient_row(sender, instance, **kwargs):
+    fields = instance.__dict__
+    instance._loaded_row = (
+        fields.get('recipe_id'), fields.get('ingredient_id'),
+        fields.get('amount'),
+    ) if instance.pk else None
+
+
+@receiver(post_save, sender=IngredientRecipe)
+def ingredient_row_saved(sender, instance, created, **kwargs):
+    new = ingredient_row(instance)
+    change_ingredient_row(None if created else instance._loaded_row, new)
+    instance._loaded_row = new
+
+
+@receiver(post_delete, sender=IngredientRecipe)
+def ingredient_row_deleted(sender, instance, **kwargs):
+    change_ingredient_row(ingredient_row(instance), None)
+
+
+@receiver(post_init, sender=Recipe)
+def remember_image(sender, instance, **kwargs):
+    instance._loaded_image = instance.__dict__.get('image')
+
+
+@receiver(pre_save, sender=Recipe)
+def reset_image_status(sender, instance, **kwargs):
+    instance._image_changed = (
+        instance._state.adding
+        or instance.image.name != instance._loaded_image
+    )
+    if instance._image_changed:
+        instance.image_status = Recipe.IMAGE_PENDING
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    """
+    Новая картинка ставится в очередь в той же транзакции,
+    ее обработает run_worker.
+    """
+    name = instance.image.name
+    instance._loaded_image = name
+    if name and instance._image_changed:
+        enqueue_image(name)
+
+
+def relation_saved(sender, instance, created, **kwargs):
+    if created:
+        model, foreign_key, field = COUNTED_RELATIONS[sender]
+        change_counter(model, getattr(instance, foreign_key), field, 1)
+
+
+def relation_deleted(sender, instance, **kwargs):
+    model, foreign_key, field = COUNTED_RELATIONS[sender]
+    change_counter(model, getattr(instance, foreign_key), field, -1)
+
+
+for relation in COUNTED_RELATIONS:
+    post_save.connect(relation_saved, sender=relation)
+    post_delete.connect(relation_deleted, sender=relation)
+
+for relation in FLAG_OWNERS:
+    post_save.connect(flags_changed, sender=relation)
+    post_delete.connect(flags_changed, sender=relation)
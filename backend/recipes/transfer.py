@@ -0,0 +1,366 @@
+import itertools
+import json
+from collections import Counter
+from functools import partial
+from pathlib import PurePosixPath
+
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from users.models import User
+
+from .counters import change_counter
+from .images import enqueue_images, unprocessed_images
+from .ingredient_index import invalidate_index
+from .models import Ingredient, IngredientRecipe, Recipe, Tag
+from .versions import bump_table_version, bump_version
+
+EXPORT_CHUNK_SIZE = 500
+IMPORT_BATCH_SIZE = 500
+# сколько ошибок по строкам возвращать в отчете импорта
+MAX_REPORTED_ERRORS = 100
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def export_recipes(queryset=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Рецепты в виде словарей для NDJSON, со ссылками на автора (email),
+    теги, ингридиенты (по названию) и файл картинки.
+
+    Рецепты читаются через iterator() пачками по chunk_size, теги
+    и ингридиенты каждой пачки — двумя запросами, поэтому память
+    не зависит от числа рецептов.
+    """
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    rows = queryset.order_by('pk').values(
+        'pk', 'name', 'text', 'cooking_time', 'image', 'pub_date',
+        'author__email',
+    ).iterator(chunk_size=chunk_size)
+    for chunk in batched(rows, chunk_size):
+        ids = [row['pk'] for row in chunk]
+        tags = {}
+        for recipe_id, name, color, slug in (
+            Recipe.tags.through.objects.filter(recipe_id__in=ids)
+            .order_by('pk')
+            .values_list('recipe_id', 'tag__name', 'tag__color', 'tag__slug')
+        ):
+            tags.setdefault(recipe_id, []).append(
+                {'name': name, 'color': color, 'slug': slug})
+        ingredients = {}
+        for recipe_id, name, unit, amount in (
+            IngredientRecipe.objects.filter(recipe_id__in=ids)
+            .order_by('pk')
+            .values_list(
+                'recipe_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount')
+        ):
+            ingredients.setdefault(recipe_id, []).append(
+                {'name': name, 'measurement_unit': unit, 'amount': amount})
+        for row in chunk:
+            yield {
+                'name': row['name'],
+                'text': row['text'],
+                'cooking_time': row['cooking_time'],
+                'image': row['image'],
+                'author': row['author__email'],
+                'pub_date': row['pub_date'].isoformat(),
+                'tags': tags.get(row['pk'], []),
+                'ingredients': ingredients.get(row['pk'], []),
+            }
+
+
+def to_ndjson(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def is_text(value, max_length=None):
+    return (
+        isinstance(value, str) and value.strip() != ''
+        and (max_length is None or len(value) <= max_length)
+    )
+
+
+def is_positive(value):
+    return (
+        isinstance(value, int) and not isinstance(value, bool) and value > 0
+    )
+
+
+def is_image_path(value):
+    """
+    Относительный путь к уже загруженному файлу в папке recipes/
+    хранилища, без выхода за ее пределы.
+    """
+    if not is_text(value, 100) or '\\' in value:
+        return False
+    parts = PurePosixPath(value).parts
+    return (
+        len(parts) > 1 and parts[0] == 'recipes' and '..' not in parts
+        and default_storage.exists(value)
+    )
+
+
+def validate_fields(record):
+    errors = []
+    if not is_text(record.get('name'), 200):
+        errors.append('name: непустая строка до 200 символов')
+    if not is_text(record.get('text')):
+        errors.append('text: непустая строка')
+    if not is_positive(record.get('cooking_time')):
+        errors.append('cooking_time: целое число больше 0')
+    if not is_image_path(record.get('image')):
+        errors.append(
+            'image: путь до 100 символов к загруженному файлу в recipes/')
+    author = record.get('author')
+    if author is not None and not is_text(author):
+        errors.append('author: email автора')
+    pub_date = record.get('pub_date')
+    if pub_date is not None and (
+            not isinstance(pub_date, str) or parse_datetime(pub_date) is None):
+        errors.append('pub_date: дата в формате ISO 8601')
+    return errors
+
+
+def validate_relations(record):
+    errors = []
+    tags = record.get('tags')
+    if not isinstance(tags, list) or not tags or not all(
+            isinstance(tag, dict) and is_text(tag.get('slug'), 50)
+            for tag in tags):
+        errors.append('tags: непустой список тегов со slug')
+    ingredients = record.get('ingredients')
+    if not isinstance(ingredients, list) or not ingredients or not all(
+            isinstance(item, dict)
+            and is_text(item.get('name'), 200)
+            and is_text(item.get('measurement_unit'), 10)
+            and is_positive(item.get('amount'))
+            for item in ingredients):
+        errors.append(
+            'ingredients: непустой список с name, measurement_unit '
+            'и amount больше 0')
+    elif len({item['name'] for item in ingredients}) != len(ingredients):
+        errors.append('ingredients: ингридиенты должны быть уникальными')
+    return errors
+
+
+def validate_record(record):
+    """Список ошибок записи импорта; пустой, если запись корректна."""
+    if not isinstance(record, dict):
+        return ['Ожидается объект']
+    return validate_fields(record) + validate_relations(record)
+
+
+def parse_lines(lines):
+    """Разбирает строки NDJSON: (номер строки, запись, ошибки)."""
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield number, None, ['Неверный JSON']
+            continue
+        yield number, record, validate_record(record)
+
+
+def ensure_tags(tags):
+    """
+    {slug: id} для тегов записей. Недостающие создаются
+    по name и color из записи, если они заданы.
+    """
+    tags = {tag['slug']: tag for tag in tags}
+    existing = dict(
+        Tag.objects.filter(slug__in=tags).values_list('slug', 'pk'))
+    missing = [
+        Tag(slug=slug, name=tag['name'], color=tag['color'])
+        for slug, tag in tags.items()
+        if slug not in existing
+        and is_text(tag.get('name'), 50) and is_text(tag.get('color'), 10)
+    ]
+    if not missing:
+        return existing
+    Tag.objects.bulk_create(missing, ignore_conflicts=True)
+    transaction.on_commit(partial(bump_version, 'tags'))
+    transaction.on_commit(partial(bump_table_version, Tag))
+    return dict(Tag.objects.filter(slug__in=tags).values_list('slug', 'pk'))
+
+
+def ensure_ingredients(ingredients):
+    """{название: id} для ингридиентов записей, недостающие создаются."""
+    units = {item['name']: item['measurement_unit'] for item in ingredients}
+    existing = dict(
+        Ingredient.objects.filter(name__in=units).values_list('name', 'pk'))
+    missing = [
+        Ingredient(name=name, measurement_unit=unit)
+        for name, unit in units.items()
+        if name not in existing
+    ]
+    if not missing:
+        return existing
+    Ingredient.objects.bulk_create(missing, ignore_conflicts=True)
+    transaction.on_commit(invalidate_index)
+    return dict(
+        Ingredient.objects.filter(name__in=units).values_list('name', 'pk'))
+
+
+def insert_recipes(recipes):
+    """
+    bulk_create с заполнением pk. Где база не возвращает id
+    вставленных строк (SQLite), берутся последние len(recipes) id:
+    после вставки транзакция держит блокировку записи в базу,
+    и чужих строк между ними быть не может.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        return Recipe.objects.bulk_create(recipes)
+    Recipe.objects.bulk_create(recipes)
+    ids = Recipe.objects.order_by('-pk').values_list(
+        'pk', flat=True)[:len(recipes)]
+    for recipe, pk in zip(recipes, reversed(ids)):
+        recipe.pk = pk
+    return recipes
+
+
+def build_recipes(batch, authors, tag_ids, default_author, report):
+    """
+    Рецепты для вставки: [(запись, Recipe)]. Записи с неизвестным
+    автором (если нет default_author) или тегами попадают в отчет.
+    """
+    accepted = []
+    for number, record in batch:
+        author_id = authors.get(record.get('author'))
+        if author_id is None and default_author is not None:
+            author_id = default_author.pk
+        if author_id is None:
+            report(number, [f'Автор {record.get("author")} не найден'])
+            continue
+        missing = [
+            tag['slug'] for tag in record['tags']
+            if tag['slug'] not in tag_ids
+        ]
+        if missing:
+            report(number, [f'Теги не найдены: {", ".join(missing)}'])
+            continue
+        accepted.append((record, Recipe(
+            author_id=author_id,
+            name=record['name'],
+            text=record['text'],
+            cooking_time=record['cooking_time'],
+            image=record['image'],
+        )))
+    return accepted
+
+
+def set_pub_dates(accepted):
+    """Даты из записей: auto_now_add перезаписывает pub_date при вставке."""
+    dated = []
+    for record, recipe in accepted:
+        if record.get('pub_date'):
+            pub_date = parse_datetime(record['pub_date'])
+            if timezone.is_naive(pub_date):
+                pub_date = timezone.make_aware(pub_date)
+            recipe.pub_date = pub_date
+            dated.append(recipe)
+    if dated:
+        Recipe.objects.bulk_update(dated, ['pub_date'])
+
+
+@transaction.atomic
+def import_batch(batch, default_author, report):
+    """
+    Вставляет пачку проверенных записей одной транзакцией:
+    по одному INSERT на рецепты, теги и ингридиенты рецептов.
+    Возвращает число созданных рецептов.
+    """
+    records = [record for _, record in batch]
+    authors = dict(User.objects.filter(email__in={
+        record['author'] for record in records if record.get('author')
+    }).values_list('email', 'pk'))
+    tag_ids = ensure_tags(
+        tag for record in records for tag in record['tags'])
+    ingredient_ids = ensure_ingredients(
+        item for record in records for item in record['ingredients'])
+
+    accepted = build_recipes(batch, authors, tag_ids, default_author, report)
+    if not accepted:
+        return 0
+    # уже обработанные картинки (повторный импорт, перенос вместе
+    # с копиями) не перекодируются заново
+    unprocessed = unprocessed_images(
+        recipe.image.name for _, recipe in accepted)
+    for _, recipe in accepted:
+        recipe.image_status = (
+            Recipe.IMAGE_PENDING if recipe.image.name in unprocessed
+            else Recipe.IMAGE_READY)
+
+    recipes = insert_recipes([recipe for _, recipe in accepted])
+    Recipe.tags.through.objects.bulk_create([
+        Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+        for record, recipe in accepted
+        for tag_id in {tag_ids[tag['slug']] for tag in record['tags']}
+    ])
+    IngredientRecipe.objects.bulk_create([
+        IngredientRecipe(
+            recipe_id=recipe.pk,
+            ingredient_id=ingredient_ids[item['name']],
+            amount=item['amount'],
+        )
+        for record, recipe in accepted
+        for item in record['ingredients']
+    ])
+    set_pub_dates(accepted)
+
+    # bulk_create не вызывает сигналы: счетчики, очередь картинок
+    # и версии таблиц обновляются здесь
+    for author_id, count in Counter(
+            recipe.author_id for recipe in recipes).items():
+        change_counter(User, author_id, 'recipes_count', count)
+    enqueue_images(unprocessed)
+    # все таблицы, в которые пишет пачка: по ним фильтруются
+    # постраничные списки (api.signals.PAGINATED_MODELS)
+    for model in (Recipe, Recipe.tags.through, IngredientRecipe):
+        transaction.on_commit(partial(bump_table_version, model))
+    transaction.on_commit(partial(bump_version, 'recipes'))
+    return len(recipes)
+
+
+def import_recipes(lines, default_author=None,
+                   batch_size=IMPORT_BATCH_SIZE):
+    """
+    Импорт рецептов из строк NDJSON (формат export_recipes).
+    Строки читаются потоком и вставляются пачками по batch_size,
+    каждая пачка в своей транзакции. Некорректные записи
+    пропускаются и попадают в отчет. Авторы ищутся по email,
+    неизвестные заменяются на default_author.
+    """
+    result = {'created': 0, 'failed': 0, 'errors': []}
+
+    def report(number, errors):
+        result['failed'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append({'line': number, 'errors': errors})
+
+    def valid_records():
+        for number, record, errors in parse_lines(lines):
+            if errors:
+                report(number, errors)
+            else:
+                yield number, record
+
+    for batch in batched(valid_records(), batch_size):
+        result['created'] += import_batch(batch, default_author, report)
+    return result
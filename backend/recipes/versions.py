@@ -0,0 +1,65 @@
+import uuid
+
+from django.core.cache import cache
+
+
+def version_key(name):
+    return f'recipes:{name}:version'
+
+
+def new_version(key):
+    """
+    Версия взамен отсутствующей в кеше (не записывалась, вытеснена
+    или кеш очищен): ключи, построенные на прежней версии, больше
+    не используются. cache.add не перезапишет версию, которую
+    успел записать другой процесс.
+    """
+    version = uuid.uuid4().hex
+    if cache.add(key, version, None):
+        return version
+    return cache.get(key) or version
+
+
+def get_version(name):
+    """Текущая версия справочника name."""
+    key = version_key(name)
+    return cache.get(key) or new_version(key)
+
+
+def bump_version(name):
+    """
+    Помечает справочник как измененный. Версия хранится в кеше Django,
+    поэтому при общем кеше ее видят все процессы.
+    """
+    cache.set(version_key(name), uuid.uuid4().hex, None)
+
+
+def get_versions(names):
+    """Версии нескольких справочников одним обращением к кешу."""
+    keys = [version_key(name) for name in names]
+    versions = cache.get_many(keys)
+    return [versions.get(key) or new_version(key) for key in keys]
+
+
+def depends_on(queryset, *models):
+    """
+    Помечает выборку зависящей от таблиц models, которых нет в ее
+    SQL (например, условие по столбцу, который поддерживает триггер),
+    чтобы кеш COUNT(*) сбрасывался и при записи в них
+    (см. api.paginators.query_tables).
+    """
+    queryset = queryset.all()
+    query = queryset.query
+    query.version_tables = (
+        *getattr(query, 'version_tables', ()),
+        *(model._meta.db_table for model in models),
+    )
+    return queryset
+
+
+def bump_table_version(model):
+    """
+    Помечает таблицу модели как измененную, чтобы сбросить
+    закешированные COUNT(*) по ней (см. api.paginators).
+    """
+    bump_version(f'table:{model._meta.db_table}')
@@ -1,5 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from api.authentication import invalidate_user_tokens
 
 from .models import Subscribe
 
@@ -26,7 +29,10 @@ class SubscribeInline(admin.TabularInline):
 
 @admin.action(description='Блокировать пользователей')
 def blocked(modeladmin, request, queryset):
+    user_ids = list(queryset.values_list('pk', flat=True))
     queryset.update(is_active=False)
+    # update() не вызывает сигналов: токены сбрасываются явно
+    transaction.on_commit(lambda: invalidate_user_tokens(user_ids))
 
 
 @admin.action(description='Разблокировать пользователей')
@@ -43,6 +49,8 @@ class UserAdmin(admin.ModelAdmin):
         'email',
         'first_name',
         'last_name',
+        'recipes_count',
+        'followers_count',
     )
     search_fields = ('username', 'first_name', 'last_name', 'email')
     fields = (
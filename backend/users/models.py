@@ -18,6 +18,16 @@ class Custom_User(AbstractUser):
     last_name = models.CharField('last name', max_length=150)
     password = models.CharField('password', max_length=150)
     following = models.ManyToManyField('self', through='Subscribe')
+    recipes_count = models.PositiveIntegerField(
+        'Число рецептов',
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0,
+        editable=False,
+    )
     REQUIRED_FIELDS = ['email', 'first_name', 'last_name']
 
     class Meta: